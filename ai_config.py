@@ -76,5 +76,5 @@ def transcribe_audio(audio):
     
 def split_text_with_langchain(text, headers_to_split_on):
     markdown_splitter = MarkdownHeaderTextSplitter(headers_to_split_on=headers_to_split_on)
-    docs = markdown_splitter.create_documents([text])
+    docs = markdown_splitter.split_text(text)
     return docs
\ No newline at end of file
@@ -5,7 +5,7 @@ import json
 from io import BytesIO
 from gpt import read_questions_from_json, conduct_interview_with_user_input  # Import from gpt.py
 from ai_config import convert_text_to_speech, load_model
-from knowledge_retrieval import setup_knowledge_retrieval, generate_report
+from knowledge_retrieval import setup_knowledge_retrieval, get_knowledge_chains, generate_report, DEFAULT_KNOWLEDGE_BASE_ID
 from prompt_instructions import get_interview_initial_message_hr, get_default_hr_questions
 from settings import language
 from utils import save_interview_history
@@ -18,7 +18,7 @@ class InterviewState:
     def __init__(self):
         self.reset()
 
-    def reset(self, voice="alloy"):
+    def reset(self, voice="alloy", knowledge_base_id=DEFAULT_KNOWLEDGE_BASE_ID):
         self.question_count = 0
         self.interview_history = []
         self.selected_interviewer = voice
@@ -28,6 +28,19 @@ class InterviewState:
         self.admin_authenticated = False
         self.config = load_config()
         self.technical_questions = []
+        self.knowledge_base_id = knowledge_base_id
+        self.interview_chain, self.report_chain = load_knowledge_chains(knowledge_base_id)
+
+def load_knowledge_chains(knowledge_base_id=DEFAULT_KNOWLEDGE_BASE_ID):
+    # Opens the knowledge base saved by a previous upload (kept in memory per process)
+    try:
+        interview_chain, report_chain, _ = get_knowledge_chains(
+            load_model(os.getenv("OPENAI_API_KEY")), knowledge_base_id
+        )
+    except Exception as e:
+        print(f"[ERROR] Failed to load knowledge base: {e}")
+        return None, None
+    return interview_chain, report_chain
 
 def load_config():
     if os.path.exists(CONFIG_PATH):
@@ -53,13 +66,20 @@ def load_questions():
 interview_state = InterviewState()
 
 # Load knowledge base and generate technical questions
-def load_knowledge_base(file_input, n_questions_to_generate):
+def load_knowledge_base(file_input, n_questions_to_generate, knowledge_base_id=DEFAULT_KNOWLEDGE_BASE_ID,
+                        progress_callback=None):
     if not file_input:
         return "❌ Error: No document uploaded."
 
+    knowledge_base_id = knowledge_base_id or DEFAULT_KNOWLEDGE_BASE_ID
     llm = load_model(os.getenv("OPENAI_API_KEY"))
     try:
-        _, _, retriever = setup_knowledge_retrieval(llm, language=language, file_path=file_input)
+        interview_chain, report_chain, retriever = setup_knowledge_retrieval(
+            llm, language=language, file_path=file_input, knowledge_base_id=knowledge_base_id,
+            progress_callback=progress_callback,
+        )
+        interview_state.knowledge_base_id = knowledge_base_id
+        interview_state.interview_chain, interview_state.report_chain = interview_chain, report_chain
         technical_questions = generate_and_save_questions_from_pdf(file_input, n_questions_to_generate)
         save_questions(technical_questions)
 
@@ -68,7 +88,8 @@ def load_knowledge_base(file_input, n_questions_to_generate):
         return f"❌ Error: {e}"
 
 def reset_interview_action(voice):
-    interview_state.reset(voice)
+    # The next candidate is interviewed on the knowledge base loaded by the admin
+    interview_state.reset(voice, interview_state.knowledge_base_id)
     config = interview_state.config
     n_of_questions = config.get("n_of_questions", 5)
     initial_message = {
@@ -119,8 +140,12 @@ def update_config(n_of_questions, interview_type):
     save_config(config)
     return "✅ Configuration updated successfully."
 
-def update_knowledge_base_and_generate_questions(file_input, n_questions_to_generate):
-    return load_knowledge_base(file_input, n_questions_to_generate)
+def update_knowledge_base_and_generate_questions(file_input, n_questions_to_generate, knowledge_base_id,
+                                                 progress=gr.Progress()):
+    def report_embedding_progress(done, total):
+        progress(done / total, desc=f"Embedding chunks ({done}/{total})")
+
+    return load_knowledge_base(file_input, n_questions_to_generate, knowledge_base_id, report_embedding_progress)
 
 def bot_response(chatbot, message):
     config = interview_state.config
@@ -172,10 +197,11 @@ def create_app():
 
         with admin_tab:
             file_input = gr.File(label="Upload Knowledge Base Document", type="filepath")
+            knowledge_base_input = gr.Textbox(label="Knowledge Base ID (role)", value=DEFAULT_KNOWLEDGE_BASE_ID)
             n_questions_input = gr.Number(label="Number of Questions", value=10)
             update_button = gr.Button("Update Knowledge Base")
             update_status = gr.Markdown("")
-            update_button.click(update_knowledge_base_and_generate_questions, inputs=[file_input, n_questions_input], outputs=[update_status])
+            update_button.click(update_knowledge_base_and_generate_questions, inputs=[file_input, n_questions_input, knowledge_base_input], outputs=[update_status])
 
             n_questions_interview_input = gr.Number(label="Number of Questions for Interview", value=5)
             interview_type_input = gr.Dropdown(choices=["Standard", "Technical"], label="Type of Interview", value="Standard")
@@ -0,0 +1,114 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from langchain_core.embeddings import Embeddings
+
+from token_budget import count_tokens
+
+try:
+    from openai import RateLimitError
+except ImportError:
+    RateLimitError = None
+
+
+class RateLimiter:
+    """
+    Token buckets for a requests-per-minute and a tokens-per-minute budget. Both
+    refill continuously; acquire blocks until a request of the given size fits.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+        self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    def acquire(self, tokens):
+        # A batch larger than the whole budget only has to wait for a full bucket
+        tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            with self._lock:
+                self._refill()
+                if self._requests >= 1 and self._tokens >= tokens:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return
+                wait = max(
+                    (1 - self._requests) * 60 / self.requests_per_minute,
+                    (tokens - self._tokens) * 60 / self.tokens_per_minute,
+                )
+            time.sleep(max(wait, 0.01))
+
+
+def is_rate_limit_error(error):
+    if RateLimitError is not None and isinstance(error, RateLimitError):
+        return True
+    return getattr(error, "status_code", None) == 429
+
+
+class ConcurrentEmbeddings(Embeddings):
+    """
+    Wraps an embedding model so that embed_documents sends its batches
+    concurrently, within a requests-per-minute and tokens-per-minute budget.
+
+    Throttled batches are retried with exponential backoff, the vectors are
+    returned in the order of the texts, and progress_callback(done, total) is
+    called as batches complete. Queries are passed straight through.
+    """
+
+    def __init__(self, embeddings, batch_size=100, max_workers=4, requests_per_minute=3000,
+                 tokens_per_minute=1000000, max_retries=6, progress_callback=None):
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.progress_callback = progress_callback
+        self.rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+
+    @property
+    def model(self):
+        return self.embeddings.model
+
+    def _embed_batch(self, batch):
+        tokens = sum(count_tokens(text) for text in batch)
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire(tokens)
+            try:
+                return self.embeddings.embed_documents(batch)
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == self.max_retries:
+                    raise
+                delay = min(2 ** attempt, 60)
+                print(f"[WARNING] Embedding batch throttled, retrying in {delay} s: {e}")
+                time.sleep(delay)
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        batches = [texts[start:start + self.batch_size] for start in range(0, len(texts), self.batch_size)]
+        results = [None] * len(batches)
+        done = 0
+        # Progress is reported from the calling thread, where UI progress trackers live
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+            futures = {executor.submit(self._embed_batch, batch): position for position, batch in enumerate(batches)}
+            for future in as_completed(futures):
+                position = futures[future]
+                results[position] = future.result()
+                done += len(batches[position])
+                print(f"[DEBUG] Embedded {done}/{len(texts)} chunks")
+                if self.progress_callback is not None:
+                    self.progress_callback(done, len(texts))
+        return [vector for vectors in results for vector in vectors]
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
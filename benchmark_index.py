@@ -0,0 +1,137 @@
+"""
+Compares the FAISS index types supported by faiss_indexes (flat, HNSW, IVF-PQ).
+
+A synthetic corpus of clustered vectors stands in for a large knowledge base.
+Recall@k is measured against exact (flat) search, latency is per single query
+as in the interview path. Memory is reported twice: the size of the serialized
+index, and the growth of the resident set (RSS) of a fresh process reading it,
+which is what a server holds once the index is loaded.
+
+Before the timings, every index type goes through a document replacement (the
+chunks of one document removed with remove_vectors, new ones added) and is
+searched again, checking that every label found still maps to its chunk.
+
+    python benchmark_index.py [n_vectors] [dimension]
+"""
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import faiss
+import numpy as np
+import psutil
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+from faiss_indexes import DEFAULT_INDEX_PARAMS, build_faiss_index, remove_vectors
+from local_embeddings import HashingEmbeddings
+
+N_VECTORS = 50000
+DIMENSION = 384
+N_QUERIES = 500
+K = 4
+
+
+def make_corpus(n_vectors, dimension, n_clusters=200, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dimension)).astype(np.float32)
+    labels = rng.integers(n_clusters, size=n_vectors)
+    vectors = centers[labels] + 0.5 * rng.normal(size=(n_vectors, dimension)).astype(np.float32)
+    queries = centers[rng.integers(n_clusters, size=N_QUERIES)] + 0.5 * rng.normal(
+        size=(N_QUERIES, dimension)
+    ).astype(np.float32)
+    return vectors, queries
+
+
+def _loaded_rss_bytes(index_path, result_queue):
+    process = psutil.Process()
+    before = process.memory_info().rss
+    index = faiss.read_index(index_path)
+    result_queue.put(process.memory_info().rss - before)
+    del index
+
+
+def measure_loaded_rss(index):
+    """RSS growth of a new process reading the index from disk, in bytes."""
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index_path = os.path.join(tmp_dir, "index.faiss")
+        faiss.write_index(index, index_path)
+        result_queue = context.Queue()
+        process = context.Process(target=_loaded_rss_bytes, args=(index_path, result_queue))
+        process.start()
+        rss_bytes = result_queue.get()
+        process.join()
+    return rss_bytes
+
+
+def check_replace_document(index_type, vectors, n_documents=10):
+    """
+    Indexes the vectors as n_documents documents, replaces the chunks of one of
+    them, then searches with every remaining chunk's vector: each label found must
+    map to a chunk, and most chunks must find themselves.
+    """
+    chunks_per_document = len(vectors) // n_documents
+    chunk_ids = [f"doc{i // chunks_per_document}-{i}" for i in range(chunks_per_document * n_documents)]
+    vectors = vectors[:len(chunk_ids)]
+    index, params = build_faiss_index(vectors, index_type)
+    store = FAISS(HashingEmbeddings(), index, InMemoryDocstore(), {})
+    store.add_embeddings(zip(chunk_ids, vectors.tolist()), ids=chunk_ids)
+
+    replaced = [chunk_id for chunk_id in chunk_ids if chunk_id.startswith("doc3-")]
+    remove_vectors(store, replaced, index_type, params)
+    new_vectors = vectors[:len(replaced)] + 0.01
+    new_ids = [f"doc3-new-{i}" for i in range(len(replaced))]
+    store.add_embeddings(zip(new_ids, new_vectors.tolist()), ids=new_ids)
+
+    expected_ids = [chunk_id for chunk_id in chunk_ids if chunk_id not in replaced] + new_ids
+    expected_vectors = np.vstack([vectors[[chunk_id not in replaced for chunk_id in chunk_ids]], new_vectors])
+    if store.index.ntotal != len(expected_ids) or sorted(store.index_to_docstore_id.values()) != sorted(expected_ids):
+        raise RuntimeError(f"{index_type}: the index and its id map disagree after replacing a document")
+    _, labels = store.index.search(expected_vectors, K)
+    found = 0
+    for chunk_id, row in zip(expected_ids, labels):
+        row_ids = [store.index_to_docstore_id[label] for label in row if label != -1]
+        found += chunk_id in row_ids
+    if found < 0.9 * len(expected_ids):
+        raise RuntimeError(f"{index_type}: only {found} of {len(expected_ids)} chunks found after replacing a document")
+    print(f"{index_type:<6} replace check: {found}/{len(expected_ids)} chunks found after replacing a document")
+
+
+def main(n_vectors=N_VECTORS, dimension=DIMENSION):
+    n_vectors, dimension = int(n_vectors), int(dimension)
+    vectors, queries = make_corpus(n_vectors, dimension)
+    for index_type in DEFAULT_INDEX_PARAMS:
+        check_replace_document(index_type, vectors[:5000])
+    print(f"{n_vectors} vectors, dimension {dimension}, {N_QUERIES} queries, k={K}")
+
+    ground_truth = None
+    for index_type in DEFAULT_INDEX_PARAMS:
+        start = time.perf_counter()
+        index, params = build_faiss_index(vectors, index_type)
+        index.add(vectors)
+        build_seconds = time.perf_counter() - start
+
+        latencies = []
+        results = []
+        for query in queries:
+            start = time.perf_counter()
+            _, ids = index.search(query.reshape(1, -1), K)
+            latencies.append((time.perf_counter() - start) * 1000)
+            results.append(ids[0])
+        results = np.array(results)
+        if ground_truth is None:
+            ground_truth = results
+
+        recall = np.mean([len(set(found) & set(expected)) / K for found, expected in zip(results, ground_truth)])
+        serialized_mb = faiss.serialize_index(index).nbytes / (1024 * 1024)
+        rss_mb = measure_loaded_rss(index) / (1024 * 1024)
+        print(f"{index_type:<6} recall@{K}: {recall:.3f}   p95: {np.percentile(latencies, 95):.3f} ms   "
+              f"serialized: {serialized_mb:.1f} MB   loaded RSS: +{rss_mb:.1f} MB   "
+              f"build: {build_seconds:.1f} s   params: {params}")
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
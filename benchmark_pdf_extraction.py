@@ -0,0 +1,74 @@
+"""
+Compares serial PDF text extraction (extract_pdf_text) with the page-range
+sharded extraction of extract_pdf_text_parallel.
+
+Runs on the bundled exam-guide PDF and on a synthetic PDF of n_pages text-dense
+pages written to a temporary directory. Every variant must return exactly the
+same text as the serial loop; the best of REPEATS runs is reported.
+
+    python benchmark_pdf_extraction.py [n_pages] [max_workers]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+import fitz
+
+from pdf_extraction import PDF_EXTRACTION_MAX_WORKERS, extract_pdf_text, extract_pdf_text_parallel
+
+PDF_PATH = "professional_machine_learning_engineer_exam_guide_english.pdf"
+N_PAGES = 400
+REPEATS = 3
+WORDS = ("model", "pipeline", "training", "feature", "data", "serving", "monitoring", "evaluation",
+         "deployment", "metric", "latency", "experiment", "vertex", "bigquery", "tensorflow", "drift")
+
+
+def make_synthetic_pdf(path, n_pages, seed=0):
+    rng = random.Random(seed)
+    with fitz.open() as pdf:
+        for page_number in range(n_pages):
+            page = pdf.new_page()
+            lines = [" ".join(rng.choice(WORDS) for _ in range(12)) + "." for _ in range(55)]
+            page.insert_text((40, 40), f"Page {page_number + 1}\n" + "\n".join(lines), fontsize=9)
+        pdf.save(path)
+
+
+def best_time(extract, pdf_path):
+    best = None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        text = extract(pdf_path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, text
+
+
+def compare(name, pdf_path, max_workers):
+    with fitz.open(pdf_path) as pdf:
+        page_count = pdf.page_count
+    print(f"{name}: {page_count} pages")
+
+    serial_seconds, expected = best_time(extract_pdf_text, pdf_path)
+    print(f"  serial            {serial_seconds * 1000:8.1f} ms")
+    for workers in sorted({2, 4, max(max_workers, 2)}):
+        # min_pages=1 shards even the small document, to show the process start-up cost
+        seconds, text = best_time(lambda path: extract_pdf_text_parallel(path, workers, min_pages=1), pdf_path)
+        if text != expected:
+            raise RuntimeError(f"Parallel extraction with {workers} workers returned different text")
+        print(f"  {workers:2d} workers        {seconds * 1000:8.1f} ms   speedup: {serial_seconds / seconds:.2f}x")
+
+
+def main(n_pages=N_PAGES, max_workers=PDF_EXTRACTION_MAX_WORKERS):
+    n_pages, max_workers = int(n_pages), int(max_workers)
+    if os.path.exists(PDF_PATH):
+        compare("exam guide", PDF_PATH, max_workers)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        synthetic_path = os.path.join(tmp_dir, "synthetic.pdf")
+        make_synthetic_pdf(synthetic_path, n_pages)
+        compare("synthetic", synthetic_path, max_workers)
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
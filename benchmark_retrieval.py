@@ -0,0 +1,172 @@
+"""
+Compares dense, BM25 and hybrid retrieval on a labelled synthetic corpus of job
+description chunks, plus the chunks of the bundled exam-guide PDF as distractors.
+
+Each synthetic chunk describes a role: a domain, a responsibility, two tools and
+generic boilerplate; a few also name a certification. No query is a span of its
+target chunk:
+
+- certification: "which position asks for the <cert> certification" (one target)
+- tool: a tool and a domain, e.g. "kafka experience in payments" (every chunk
+  with both is relevant)
+- paraphrase: a domain and a responsibility worded differently from the chunks,
+  e.g. "creates ETL workflows" for "builds and maintains data pipelines"
+
+A query is a hit if a relevant chunk is in the top k. Reports recall@k per query
+set and the mean / p95 query latency of each retriever. The local backend only
+matches words, so the paraphrase queries need openai embeddings to be found.
+
+    python benchmark_retrieval.py [n_chunks] [local|openai] [pdf_path]
+"""
+import os
+import random
+import sys
+import time
+
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from knowledge_retrieval import get_embedding_model, get_chunk_ids, split_document
+from retrievers import BM25Index, dense_search, reciprocal_rank_fusion
+
+PDF_PATH = "professional_machine_learning_engineer_exam_guide_english.pdf"
+N_CHUNKS = 2000
+N_QUERIES = 100
+K = 4
+FETCH_K = 20
+
+DOMAINS = ("payments", "retail", "healthcare", "logistics", "gaming", "insurance", "telecom", "education")
+TOOLS = ("airflow", "kubeflow", "bigquery", "dataflow", "terraform", "tensorflow", "pytorch", "spark", "kafka",
+         "snowflake", "dbt", "mlflow", "tableau", "looker", "jenkins", "ansible", "prometheus", "grafana",
+         "elasticsearch", "redis", "postgresql", "mongodb", "fastapi", "django", "react", "typescript", "golang",
+         "scala", "hadoop", "databricks", "sagemaker", "kubernetes", "docker", "helm", "pandas", "pytest")
+CERTIFICATIONS = ("az-104", "az-900", "dp-203", "ckad", "cka", "pmp", "togaf", "cissp", "ccna", "oscp",
+                  "saa-c03", "dva-c02", "itil", "cisa", "cism", "comptia", "prince2", "csm", "safe", "cfa")
+# (wording in the chunks, wording in the queries)
+RESPONSIBILITIES = (
+    ("builds and maintains data pipelines", "creates ETL workflows"),
+    ("trains and evaluates machine learning models", "develops predictive algorithms"),
+    ("deploys services to production", "ships software releases live"),
+    ("monitors system reliability and uptime", "keeps platforms available around the clock"),
+    ("designs relational database schemas", "models tables for SQL storage"),
+    ("writes automated tests", "guarantees code quality with unit testing"),
+    ("mentors junior engineers", "coaches less experienced colleagues"),
+    ("negotiates with vendors", "manages supplier contracts"),
+    ("analyzes customer churn", "studies why clients cancel subscriptions"),
+    ("secures cloud infrastructure", "hardens access controls on AWS and GCP"),
+    ("builds dashboards for executives", "creates reports for leadership"),
+    ("optimizes query performance", "speeds up slow database lookups"),
+)
+BOILERPLATE = (
+    "The team values ownership, clear communication and collaboration across functions.",
+    "You will work closely with product managers, designers and other engineers.",
+    "We offer flexible working hours, remote options and a learning budget.",
+    "Candidates should be comfortable working in a fast-paced environment.",
+    "Strong problem-solving skills and attention to detail are expected.",
+    "The role reports to the engineering manager of the group.",
+    "Experience in an agile team with regular planning and retrospectives is a plus.",
+    "We are an equal opportunity employer and welcome applicants from all backgrounds.",
+    "You will take part in code reviews and share knowledge with the team.",
+    "Good written and spoken English is required for this position.",
+)
+
+
+def make_corpus(n_chunks, seed=0):
+    """Returns the chunks and their labels: (domain, responsibility index, tools, certification or None)."""
+    rng = random.Random(seed)
+    texts, labels = [], []
+    certifications = list(CERTIFICATIONS)
+    rng.shuffle(certifications)
+    for i in range(n_chunks):
+        domain = rng.choice(DOMAINS)
+        responsibility = rng.randrange(len(RESPONSIBILITIES))
+        tools = tuple(rng.sample(TOOLS, 2))
+        certification = certifications.pop() if certifications and rng.random() < 0.05 else None
+        sentences = [
+            f"Role {i} in our {domain} business.",
+            f"The engineer {RESPONSIBILITIES[responsibility][0]} using {tools[0]} and {tools[1]}.",
+        ]
+        if certification:
+            sentences.append(f"Holding the {certification} certification is required.")
+        sentences.extend(rng.sample(BOILERPLATE, 4))
+        texts.append(Document(page_content=" ".join(sentences), metadata={"source_id": "benchmark"}))
+        labels.append((domain, responsibility, tools, certification))
+    return texts, labels
+
+
+def build_queries(labels, chunk_ids, n_queries=N_QUERIES, seed=0):
+    """Returns {query set: [(query, relevant chunk IDs)]}."""
+    rng = random.Random(seed)
+    certification_queries = [
+        (f"Which position asks for the {certification} certification?", {chunk_id})
+        for chunk_id, (_, _, _, certification) in zip(chunk_ids, labels) if certification
+    ]
+
+    def relevant(match):
+        return {chunk_id for chunk_id, label in zip(chunk_ids, labels) if match(*label)}
+
+    tool_queries, paraphrase_queries = [], []
+    for _ in range(n_queries):
+        domain, tool = rng.choice(DOMAINS), rng.choice(TOOLS)
+        ids = relevant(lambda d, r, tools, c: d == domain and tool in tools)
+        if ids:
+            tool_queries.append((f"Looking for {tool} experience in {domain}", ids))
+        domain, responsibility = rng.choice(DOMAINS), rng.randrange(len(RESPONSIBILITIES))
+        ids = relevant(lambda d, r, tools, c: d == domain and r == responsibility)
+        if ids:
+            paraphrase_queries.append((f"Someone who {RESPONSIBILITIES[responsibility][1]} for {domain}", ids))
+    return {"certification": certification_queries, "tool": tool_queries, "paraphrase": paraphrase_queries}
+
+
+def evaluate(name, search, query_sets):
+    results = []
+    latencies = []
+    for queries in query_sets.values():
+        hits = 0
+        for query, relevant_ids in queries:
+            start = time.perf_counter()
+            doc_ids = search(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits += bool(relevant_ids.intersection(doc_ids[:K]))
+        results.append(f"{hits / max(len(queries), 1):.3f}")
+    latencies = np.array(latencies)
+    print(f"{name:<8} " + "".join(f"{result:>15}" for result in results) +
+          f"   mean: {latencies.mean():.2f} ms   p95: {np.percentile(latencies, 95):.2f} ms")
+
+
+def main(n_chunks=N_CHUNKS, backend="local", pdf_path=PDF_PATH):
+    embedding_model = get_embedding_model(backend)
+    texts, labels = make_corpus(int(n_chunks))
+    chunk_ids = get_chunk_ids("benchmark", texts)
+    query_sets = build_queries(labels, chunk_ids)
+    if os.path.exists(pdf_path):
+        pdf_texts = split_document(pdf_path, "pdf")
+        texts, chunk_ids = texts + pdf_texts, chunk_ids + get_chunk_ids("pdf", pdf_texts)
+
+    documents_faiss_index = FAISS.from_documents(texts, embedding_model, ids=chunk_ids)
+    bm25_index = BM25Index()
+    for chunk_id, text in zip(chunk_ids, texts):
+        bm25_index.add(chunk_id, text.page_content)
+
+    print(f"{len(texts)} chunks, {backend} embeddings, "
+          + ", ".join(f"{len(queries)} {name} queries" for name, queries in query_sets.items()))
+
+    def dense(query):
+        return dense_search(documents_faiss_index, query, K)
+
+    def bm25(query):
+        return [doc_id for doc_id, _ in bm25_index.search(query, K)]
+
+    def hybrid(query):
+        keyword_ids = [doc_id for doc_id, _ in bm25_index.search(query, FETCH_K)]
+        return reciprocal_rank_fusion([dense_search(documents_faiss_index, query, FETCH_K), keyword_ids], k=K)
+
+    print(f"recall@{K} " + "".join(f"{name:>15}" for name in query_sets))
+    evaluate("dense", dense, query_sets)
+    evaluate("bm25", bm25, query_sets)
+    evaluate("hybrid", hybrid, query_sets)
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
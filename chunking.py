@@ -0,0 +1,205 @@
+import re
+
+from langchain.text_splitter import MarkdownHeaderTextSplitter
+
+from token_budget import DEFAULT_MODEL, count_tokens, get_encoding
+
+
+def iter_split_text_slices(text_slices, text_splitter):
+    """
+    Splits a text that arrives in slices (e.g. the pages of a PDF) with a
+    LangChain text splitter, yielding chunks as soon as they are complete.
+
+    The last chunk of each slice may continue in the next slice, so it is held
+    back and split again together with the next slice. Only one slice and one
+    chunk are held in memory at a time.
+    """
+    carry = ""
+    for text_slice in text_slices:
+        chunks = text_splitter.split_text(f"{carry}\n{text_slice}" if carry else text_slice)
+        if not chunks:
+            continue
+        yield from chunks[:-1]
+        carry = chunks[-1]
+    if carry:
+        yield carry
+
+
+WORD_PATTERN = re.compile(r"\S+")
+
+
+def iter_words(pages):
+    """
+    Yields the whitespace-separated words of a text that arrives in pages, as
+    "".join(pages).split() would. A word cut by a page boundary is carried over
+    and joined with its end on the next page.
+    """
+    carry = ""
+    for page in pages:
+        if carry and page and page[0].isspace():
+            yield carry
+            carry = ""
+        for match in WORD_PATTERN.finditer(page):
+            word = match.group()
+            if carry:
+                word = carry + word
+                carry = ""
+            if match.end() == len(page):
+                carry = word
+            else:
+                yield word
+    if carry:
+        yield carry
+
+
+def iter_word_chunks(pages, chunk_size):
+    """
+    Packs the words of a text (a string or an iterable of page strings) into
+    chunks of at most chunk_size characters, joined by single spaces, yielding
+    each chunk as soon as it is full. Only the current chunk is held in memory.
+
+    The sizes are those of the original split_text_into_chunks: each word counts
+    one extra character, a text without words gives one empty chunk, and a
+    word longer than chunk_size gets a chunk of its own (preceded by an empty
+    chunk if it is the first word).
+    """
+    if isinstance(pages, str):
+        pages = [pages]
+    current_chunk = []
+    current_length = 0
+    has_words = False
+    for word in iter_words(pages):
+        has_words = True
+        if current_length + len(word) + 1 > chunk_size:
+            yield " ".join(current_chunk)
+            current_chunk = [word]
+            current_length = len(word)
+        else:
+            current_chunk.append(word)
+            current_length += len(word) + 1
+    if not has_words:
+        # "".split(" ") is [""]: the empty text is one empty word
+        if 1 > chunk_size:
+            yield ""
+        current_chunk = [""]
+    if current_chunk:
+        yield " ".join(current_chunk)
+
+
+def split_text_into_chunks(text, chunk_size):
+    """
+    Splits the text into chunks of a specified maximum size.
+    """
+    return list(iter_word_chunks(text, chunk_size))
+
+
+# Markdown headings the chunker splits sections on
+MARKDOWN_HEADERS = [("#", "Header 1"), ("##", "Header 2"), ("###", "Header 3")]
+MARKDOWN_HEADING_PATTERN = re.compile(r"^#{1,3}\s+\S", re.MULTILINE)
+# Sentence ends, and paragraph breaks for text without punctuation (lists, titles)
+SENTENCE_BOUNDARY_PATTERN = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+
+
+def split_sections(text):
+    """
+    Splits markdown text on its headings, prefixing each section with its heading
+    path so a chunk keeps its context. Text without headings is one section.
+    """
+    if not MARKDOWN_HEADING_PATTERN.search(text):
+        return [text]
+    sections = []
+    for document in MarkdownHeaderTextSplitter(headers_to_split_on=MARKDOWN_HEADERS).split_text(text):
+        headings = [document.metadata[name] for _, name in MARKDOWN_HEADERS if name in document.metadata]
+        sections.append("\n".join(headings) + "\n\n" + document.page_content if headings else document.page_content)
+    return sections
+
+
+def split_sentences(text):
+    sentences = (" ".join(sentence.split()) for sentence in SENTENCE_BOUNDARY_PATTERN.split(text))
+    return [sentence for sentence in sentences if sentence]
+
+
+class TokenChunker:
+    """
+    Splits text into chunks of about chunk_tokens tokens (tiktoken) along natural
+    boundaries: whole markdown sections when they fit, otherwise whole sentences.
+    Only a sentence longer than a chunk is cut mid-sentence, on token boundaries.
+    Consecutive chunks of a section share up to overlap_tokens of trailing
+    sentences.
+
+    split_text has the signature of a LangChain text splitter, so the chunker can
+    be used with iter_split_text_slices.
+    """
+
+    def __init__(self, chunk_tokens=300, overlap_tokens=30, model=DEFAULT_MODEL):
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.model = model
+
+    def split_text(self, text):
+        chunks = []
+        current = []
+        current_tokens = 0
+        for section in split_sections(text):
+            section = section.strip()
+            if not section:
+                continue
+            section_tokens = count_tokens(section, self.model)
+            # Small sections are packed together; a section is never cut if it fits in a chunk
+            if current_tokens + section_tokens <= self.chunk_tokens:
+                current.append(section)
+                current_tokens += section_tokens
+                continue
+            if current:
+                chunks.append("\n\n".join(current))
+            if section_tokens <= self.chunk_tokens:
+                current, current_tokens = [section], section_tokens
+                continue
+            section_chunks = self._split_section(section)
+            chunks.extend(section_chunks[:-1])
+            current = [section_chunks[-1]]
+            current_tokens = count_tokens(section_chunks[-1], self.model)
+        if current:
+            chunks.append("\n\n".join(current))
+        return chunks
+
+    def _split_section(self, section):
+        chunks = []
+        current = []
+        current_tokens = 0
+        for sentence in self._sentences(section):
+            sentence_tokens = count_tokens(sentence, self.model)
+            if current and current_tokens + sentence_tokens > self.chunk_tokens:
+                chunks.append(" ".join(current))
+                # Start the next chunk with the last sentences, up to overlap_tokens
+                overlap = []
+                overlap_tokens = 0
+                for previous in reversed(current):
+                    previous_tokens = count_tokens(previous, self.model)
+                    if overlap_tokens + previous_tokens > self.overlap_tokens:
+                        break
+                    overlap.insert(0, previous)
+                    overlap_tokens += previous_tokens
+                if overlap_tokens + sentence_tokens > self.chunk_tokens:
+                    overlap, overlap_tokens = [], 0
+                current, current_tokens = overlap, overlap_tokens
+            current.append(sentence)
+            current_tokens += sentence_tokens
+        if current:
+            chunks.append(" ".join(current))
+        return chunks
+
+    def _sentences(self, section):
+        for sentence in split_sentences(section):
+            if count_tokens(sentence, self.model) <= self.chunk_tokens:
+                yield sentence
+                continue
+            # A sentence longer than a chunk is cut into chunk-sized pieces
+            encoding = get_encoding(self.model)
+            if encoding is None:
+                step = self.chunk_tokens * 4
+                yield from (sentence[start:start + step] for start in range(0, len(sentence), step))
+                continue
+            tokens = encoding.encode(sentence, disallowed_special=())
+            for start in range(0, len(tokens), self.chunk_tokens):
+                yield encoding.decode(tokens[start:start + self.chunk_tokens])
@@ -0,0 +1,95 @@
+import zlib
+
+import numpy as np
+
+# Hash family of the MinHash permutations: (a * h + b) mod a Mersenne prime.
+# a and b are below 2^31 and shingle hashes below 2^32, so a * h + b fits in uint64.
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+DEFAULT_THRESHOLD = 0.9
+DEFAULT_NUM_PERM = 128
+DEFAULT_SHINGLE_SIZE = 5
+# Documents whose shingles are hashed together, bounding the (shingles, num_perm) matrix
+SIGNATURE_BATCH_SIZE = 256
+
+
+def shingle_hashes(text, shingle_size=DEFAULT_SHINGLE_SIZE):
+    """32-bit hashes of the word shingles of a text (lower-cased, whitespace-normalized)."""
+    words = text.lower().split()
+    if len(words) <= shingle_size:
+        shingles = {" ".join(words)}
+    else:
+        shingles = {" ".join(words[start:start + shingle_size]) for start in range(len(words) - shingle_size + 1)}
+    return np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles), dtype=np.uint64)
+
+
+def minhash_signatures(texts, num_perm=DEFAULT_NUM_PERM, shingle_size=DEFAULT_SHINGLE_SIZE, seed=1):
+    """
+    Computes the MinHash signature of each text, as a (len(texts), num_perm)
+    uint64 array. The shingles of a batch of texts are hashed with all the
+    permutations at once and reduced per text with np.minimum.reduceat.
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 1 << 31, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, 1 << 31, size=num_perm, dtype=np.uint64)
+
+    signatures = np.empty((len(texts), num_perm), dtype=np.uint64)
+    for start in range(0, len(texts), SIGNATURE_BATCH_SIZE):
+        batch = [shingle_hashes(text, shingle_size) for text in texts[start:start + SIGNATURE_BATCH_SIZE]]
+        offsets = np.cumsum([0] + [len(hashes) for hashes in batch[:-1]])
+        hashes = np.concatenate(batch)
+        permuted = (hashes[:, None] * a[None, :] + b[None, :]) % MERSENNE_PRIME
+        signatures[start:start + len(batch)] = np.minimum.reduceat(permuted, offsets, axis=0)
+    return signatures
+
+
+def lsh_bands(num_perm, threshold):
+    """
+    Picks the number of LSH bands (and rows per band) whose candidate threshold
+    (1 / bands) ** (1 / rows) is closest to the similarity threshold.
+    """
+    options = [(bands, num_perm // bands) for bands in range(1, num_perm + 1) if num_perm % bands == 0]
+    return min(options, key=lambda option: abs((1 / option[0]) ** (1 / option[1]) - threshold))
+
+
+def deduplicate_texts(texts, threshold=DEFAULT_THRESHOLD, num_perm=DEFAULT_NUM_PERM,
+                      shingle_size=DEFAULT_SHINGLE_SIZE):
+    """
+    Finds near-duplicate texts with MinHash and locality-sensitive hashing.
+
+    Texts that share an LSH bucket are compared on their signatures, and a text
+    whose estimated Jaccard similarity to an earlier kept text is at least
+    threshold is dropped. The first occurrence is always kept.
+
+    Args:
+        texts: The texts to deduplicate (e.g. chunks), in document order.
+        threshold: Estimated Jaccard similarity of the word shingles from which
+            two texts are duplicates. 0 disables deduplication.
+        num_perm: Number of MinHash permutations.
+        shingle_size: Number of words per shingle.
+
+    Returns:
+        A (kept_indices, stats) tuple: the indices of the texts to keep, in order,
+        and a dict with the "total", "kept" and "dropped" counts.
+    """
+    if not texts or threshold <= 0:
+        return list(range(len(texts))), {"total": len(texts), "kept": len(texts), "dropped": 0}
+
+    signatures = minhash_signatures(texts, num_perm, shingle_size)
+    bands, rows = lsh_bands(num_perm, threshold)
+    buckets = {}
+    kept_indices = []
+    for index, signature in enumerate(signatures):
+        band_keys = [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(bands)]
+        candidates = {candidate for key in band_keys for candidate in buckets.get(key, ())}
+        if candidates:
+            candidates = np.fromiter(candidates, dtype=np.int64)
+            similarities = (signatures[candidates] == signature).mean(axis=1)
+            if similarities.max() >= threshold:
+                continue
+        kept_indices.append(index)
+        for key in band_keys:
+            buckets.setdefault(key, []).append(index)
+
+    stats = {"total": len(texts), "kept": len(kept_indices), "dropped": len(texts) - len(kept_indices)}
+    print(f"[INFO] Near-duplicate chunks dropped: {stats['dropped']} of {stats['total']}")
+    return kept_indices, stats
@@ -0,0 +1,175 @@
+import math
+import os
+import time
+
+import faiss
+import numpy as np
+
+# Build and search parameters of each supported index type. "flat" is exact
+# search; "hnsw" and "ivfpq" are approximate and trade some recall for lower
+# query time ("hnsw") or much lower memory ("ivfpq") on large knowledge bases.
+DEFAULT_INDEX_PARAMS = {
+    "flat": {},
+    "hnsw": {"M": 32, "ef_construction": 200, "ef_search": 64},
+    "ivfpq": {"nlist": 256, "m": 16, "nbits": 8, "nprobe": 16},
+}
+
+# IVF-PQ needs enough vectors to train its quantizers: below this many, an
+# "ivfpq" knowledge base is kept as a flat index. It is (re)trained once it
+# holds IVFPQ_RETRAIN_GROWTH times the vectors it was last trained on.
+IVFPQ_MIN_TRAINING_VECTORS = 1024
+IVFPQ_RETRAIN_GROWTH = 4
+
+# HNSW graphs cannot drop vectors: every replace or delete rebuilds the whole
+# graph. Above this many vectors the rebuild is refused; use a "flat" or
+# "ivfpq" index for large knowledge bases that are edited often.
+HNSW_MAX_REBUILD_VECTORS = int(os.getenv("HNSW_MAX_REBUILD_VECTORS", 100000))
+
+
+def get_index_params(index_type, params=None):
+    if index_type not in DEFAULT_INDEX_PARAMS:
+        raise RuntimeError(f"Unsupported FAISS index type: {index_type}")
+    return {**DEFAULT_INDEX_PARAMS[index_type], **(params or {})}
+
+
+def build_faiss_index(vectors, index_type="flat", params=None):
+    """
+    Creates an empty FAISS index of the given type, ready for the vectors to be
+    added. IVF-PQ is trained on the vectors; nlist, m and nbits are reduced when
+    there are too few vectors or dimensions to train them, and below
+    IVFPQ_MIN_TRAINING_VECTORS a flat index is built instead. params["trained_size"]
+    records the number of training vectors (0 for the flat stand-in).
+
+    Args:
+        vectors: float32 array of shape (n, dimension) the index is built for.
+        index_type: "flat", "hnsw" or "ivfpq".
+        params: Overrides for DEFAULT_INDEX_PARAMS[index_type].
+
+    Returns:
+        A (index, params) tuple, where params are the values actually used, to be
+        persisted with the index.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n_vectors, dimension = vectors.shape
+    params = get_index_params(index_type, params)
+
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dimension)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, params["M"])
+        index.hnsw.efConstruction = params["ef_construction"]
+    elif n_vectors < IVFPQ_MIN_TRAINING_VECTORS:
+        index = faiss.IndexFlatL2(dimension)
+        params["trained_size"] = 0
+    else:
+        # k-means needs a few dozen points per list, and PQ needs 2^nbits points
+        params["nlist"] = max(1, min(params["nlist"], n_vectors // 39))
+        params["nbits"] = max(1, min(params["nbits"], int(math.log2(max(n_vectors, 2)))))
+        params["m"] = max(m for m in range(1, min(params["m"], dimension) + 1) if dimension % m == 0)
+        quantizer = faiss.IndexFlatL2(dimension)
+        index = faiss.IndexIVFPQ(quantizer, dimension, params["nlist"], params["m"], params["nbits"])
+        index.train(vectors)
+        params["trained_size"] = n_vectors
+
+    apply_search_params(index, index_type, params)
+    return index, params
+
+
+def apply_search_params(index, index_type, params):
+    if index_type == "hnsw":
+        index.hnsw.efSearch = params["ef_search"]
+    elif index_type == "ivfpq" and faiss.try_extract_index_ivf(index) is not None:
+        index.nprobe = params["nprobe"]
+
+
+def needs_retraining(index, index_type, params):
+    """
+    True when an IVF-PQ index should be rebuilt from its vectors: it is still the
+    flat stand-in of a small knowledge base and has reached the minimum training
+    size, or it has grown IVFPQ_RETRAIN_GROWTH times past its training set.
+    Indexes saved before trained_size was recorded are retrained once.
+    """
+    if index_type != "ivfpq":
+        return False
+    trained_size = params.get("trained_size", 0)
+    return index.ntotal >= max(IVFPQ_MIN_TRAINING_VECTORS, trained_size * IVFPQ_RETRAIN_GROWTH)
+
+
+def enable_reconstruction(index):
+    """
+    Lets the stored vectors of an IVF index be read back by label (reconstruct),
+    by giving it a hash table direct map. Other index types always allow it.
+    Call it once when the index is loaded: it must not race with searches.
+    """
+    ivf_index = faiss.try_extract_index_ivf(index)
+    if ivf_index is not None and ivf_index.direct_map.type == faiss.DirectMap.NoMap:
+        ivf_index.set_direct_map_type(faiss.DirectMap.Hashtable)
+
+
+def _renumber_ivf_labels(ivf_index, new_labels):
+    # Rewrites the label of every stored vector in place; the codes are unchanged
+    invlists = ivf_index.invlists
+    for list_no in range(ivf_index.nlist):
+        list_size = invlists.list_size(list_no)
+        if list_size == 0:
+            continue
+        labels = new_labels[faiss.rev_swig_ptr(invlists.get_ids(list_no), list_size)]
+        codes = faiss.rev_swig_ptr(invlists.get_codes(list_no), list_size * invlists.code_size).copy()
+        invlists.update_entries(list_no, 0, list_size, faiss.swig_ptr(labels), faiss.swig_ptr(codes))
+
+
+def remove_vectors(documents_faiss_index, doc_ids, index_type, params):
+    """
+    Deletes chunks from a FAISS store. Index types that cannot remove vectors in
+    place (HNSW) are rebuilt from their stored vectors, without re-embedding: the
+    cost is that of indexing the whole store, up to HNSW_MAX_REBUILD_VECTORS.
+
+    The store maps index labels to chunks by position (0..ntotal-1), and
+    FAISS.delete renumbers that map as if the index were compacted. IVF indexes
+    keep the labels of their remaining vectors, so they are renumbered the same way.
+    """
+    # Small "ivfpq" knowledge bases are flat indexes until they are trained
+    if index_type == "ivfpq" and faiss.try_extract_index_ivf(documents_faiss_index.index) is None:
+        index_type = "flat"
+    if index_type not in ("hnsw", "ivfpq"):
+        documents_faiss_index.delete(doc_ids)
+        return
+
+    if index_type == "ivfpq":
+        ivf_index = faiss.extract_index_ivf(documents_faiss_index.index)
+        direct_map_type = ivf_index.direct_map.type
+        ivf_index.set_direct_map_type(faiss.DirectMap.NoMap)
+        n_labels = len(documents_faiss_index.index_to_docstore_id)
+        removed = set(doc_ids)
+        removed_labels = [label for label, doc_id in documents_faiss_index.index_to_docstore_id.items() if doc_id in removed]
+        documents_faiss_index.delete(doc_ids)
+        kept = np.ones(n_labels, dtype=bool)
+        kept[removed_labels] = False
+        new_labels = np.cumsum(kept, dtype=np.int64) - 1
+        _renumber_ivf_labels(ivf_index, new_labels)
+        ivf_index.set_direct_map_type(direct_map_type)
+        return
+
+    doc_ids = set(doc_ids)
+    index = documents_faiss_index.index
+    if index.ntotal > HNSW_MAX_REBUILD_VECTORS:
+        raise RuntimeError(
+            f"Removing chunks from an HNSW index rebuilds all its {index.ntotal} vectors, more than "
+            f"HNSW_MAX_REBUILD_VECTORS ({HNSW_MAX_REBUILD_VECTORS}); use a flat or ivfpq index, or raise the limit."
+        )
+    start = time.perf_counter()
+    vectors = index.reconstruct_n(0, index.ntotal)
+    keep = [
+        position
+        for position, doc_id in sorted(documents_faiss_index.index_to_docstore_id.items())
+        if doc_id not in doc_ids
+    ]
+    remaining_ids = [documents_faiss_index.index_to_docstore_id[position] for position in keep]
+
+    vectors = vectors[keep].reshape(-1, index.d)
+    documents_faiss_index.index, _ = build_faiss_index(vectors, index_type, params)
+    documents_faiss_index.index.add(vectors)
+    documents_faiss_index.docstore.delete(list(doc_ids))
+    documents_faiss_index.index_to_docstore_id = dict(enumerate(remaining_ids))
+    print(f"[WARNING] Rebuilt the HNSW index ({len(remaining_ids)} vectors) to remove {len(doc_ids)} chunks "
+          f"in {time.perf_counter() - start:.1f}s")
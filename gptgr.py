@@ -5,6 +5,7 @@ from dotenv import load_dotenv
 import gradio as gr
 from langchain_openai import ChatOpenAI
 from langchain.schema import HumanMessage, SystemMessage
+from token_budget import fit_history, truncate_to_tokens, record_chat_usage, HISTORY_TOKEN_BUDGET, USER_INPUT_TOKEN_BUDGET
 
 # Load environment variables
 load_dotenv()
@@ -28,8 +29,9 @@ def conduct_interview(questions, language="English", history_limit=5):
     if not openai_api_key:
         raise RuntimeError("OpenAI API key not found. Please add it to your .env file as OPENAI_API_KEY.")
 
+    model = "gpt-4"
     chat = ChatOpenAI(
-        openai_api_key=openai_api_key, model="gpt-4", temperature=0.7, max_tokens=750
+        openai_api_key=openai_api_key, model=model, temperature=0.7, max_tokens=750
     )
 
     conversation_history = deque(maxlen=history_limit)
@@ -46,12 +48,16 @@ def conduct_interview(questions, language="English", history_limit=5):
     def interview_step(user_input, history):
         if user_input.lower() in ["exit", "quit"]:
             history.append((None, "The interview has ended at your request. Thank you for your time!"))
-            return history, ""
+            yield history, ""
+            return
 
         question_text = questions[current_question_index[0]]
-        history_content = "\n".join([f"Q: {entry['question']}\nA: {entry['answer']}" for entry in conversation_history])
+        # Keep the prompt within budget: most recent history first, long inputs cut
+        history_content = "\n".join(fit_history([f"Q: {entry['question']}\nA: {entry['answer']}" for entry in conversation_history],
+                                                HISTORY_TOKEN_BUDGET, model))
+        prompt_input = truncate_to_tokens(user_input, USER_INPUT_TOKEN_BUDGET, model)
         combined_prompt = (f"{system_prompt}\n\nPrevious conversation history:\n{history_content}\n\n"
-                           f"Current question: {question_text}\nUser's input: {user_input}\n\n"
+                           f"Current question: {question_text}\nUser's input: {prompt_input}\n\n"
                            "Respond in a warm and conversational way, offering natural follow-ups if needed.")
 
         messages = [
@@ -59,22 +65,28 @@ def conduct_interview(questions, language="English", history_limit=5):
             HumanMessage(content=combined_prompt)
         ]
 
-        response = chat.invoke(messages)
-        response_content = response.content.strip()
+        # Stream the response into the chat as it is generated
+        history.append((user_input, None))
+        history.append((None, ""))
+        response = None
+        for chunk in chat.stream(messages):
+            response = chunk if response is None else response + chunk
+            history[-1] = (None, response.content)
+            yield history, ""
+        record_chat_usage("interview_step", model, system_prompt + combined_prompt, response)
+        response_content = response.content.strip() if response else ""
+        history[-1] = (None, response_content)
 
         conversation_history.append({"question": question_text, "answer": user_input})
         interview_data.append({"question": question_text, "answer": user_input})
-        history.append((user_input, None))
-        history.append((None, response_content))
 
         if current_question_index[0] + 1 < len(questions):
             current_question_index[0] += 1
             next_question = f"Alright, let's move on. {questions[current_question_index[0]]}"
             history.append((None, next_question))
-            return history, ""
         else:
             history.append((None, "That wraps up our interview. Thank you so much for your responses—it's been great learning more about you!"))
-            return history, ""
+        yield history, ""
 
     return interview_step, initial_message
 
@@ -124,12 +136,13 @@ def main():
                 return [], ""
 
             def interview_step(user_response, history):
-                return interview_func(user_response, history)
+                yield from interview_func(user_response, history)
 
             def on_enter_submit(history, user_response):
                 if not user_response.strip():
-                    return history, ""
-                return interview_step(user_response, history)
+                    yield history, ""
+                    return
+                yield from interview_step(user_response, history)
 
             start_btn.click(start_interview, inputs=[], outputs=[chatbot, user_input])
             submit_btn.click(interview_step, inputs=[user_input, chatbot], outputs=[chatbot, user_input])
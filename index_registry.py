@@ -0,0 +1,99 @@
+import threading
+from collections import OrderedDict
+
+
+class KnowledgeIndexRegistry:
+    """
+    Keeps the retrieval chains of many knowledge bases in memory, keyed by knowledge
+    base ID (e.g. one per role or job description).
+
+    Entries are evicted least-recently-used first once the total size of the loaded
+    indexes exceeds max_bytes; an evicted knowledge base is reloaded from disk by the
+    loader the next time it is requested. The most recently used entry is never
+    evicted, so a single index larger than the budget still works.
+
+    Loading runs outside the registry lock, so a cold load of one knowledge base
+    does not block lookups of the others. Concurrent requests for the same
+    knowledge base wait for a single load.
+
+    Args:
+        loader: Callable taking a knowledge base ID (plus any extra arguments given
+            to get) and returning a (value, n_bytes) tuple, or None if the knowledge
+            base does not exist.
+        max_bytes: Memory budget for all loaded indexes.
+    """
+
+    def __init__(self, loader, max_bytes):
+        self.loader = loader
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._load_locks = {}
+        # Bumped by put and evict, so a load that raced with them is not cached
+        self._generations = {}
+
+    def _lookup(self, knowledge_base_id):
+        with self._lock:
+            if knowledge_base_id in self._entries:
+                self._entries.move_to_end(knowledge_base_id)
+                return True, self._entries[knowledge_base_id][0]
+            return False, None
+
+    def get(self, knowledge_base_id, *loader_args):
+        found, value = self._lookup(knowledge_base_id)
+        if found:
+            return value
+
+        with self._lock:
+            load_lock = self._load_locks.setdefault(knowledge_base_id, threading.Lock())
+        with load_lock:
+            # Another thread may have loaded it while this one waited
+            found, value = self._lookup(knowledge_base_id)
+            if found:
+                return value
+            with self._lock:
+                generation = self._generations.get(knowledge_base_id, 0)
+
+            loaded = self.loader(knowledge_base_id, *loader_args)
+            if loaded is None:
+                return None
+            value, n_bytes = loaded
+            with self._lock:
+                if self._generations.get(knowledge_base_id, 0) != generation:
+                    # Updated or evicted during the load: keep the newer state
+                    found, current = self._lookup(knowledge_base_id)
+                    return current if found else value
+                self._put(knowledge_base_id, value, n_bytes)
+            return value
+
+    def put(self, knowledge_base_id, value, n_bytes):
+        with self._lock:
+            self._bump(knowledge_base_id)
+            self._put(knowledge_base_id, value, n_bytes)
+
+    def evict(self, knowledge_base_id):
+        with self._lock:
+            self._bump(knowledge_base_id)
+            self._entries.pop(knowledge_base_id, None)
+
+    def _bump(self, knowledge_base_id):
+        self._generations[knowledge_base_id] = self._generations.get(knowledge_base_id, 0) + 1
+
+    def loaded_ids(self):
+        with self._lock:
+            return list(self._entries)
+
+    @property
+    def total_bytes(self):
+        with self._lock:
+            return sum(n_bytes for _, n_bytes in self._entries.values())
+
+    def _put(self, knowledge_base_id, value, n_bytes):
+        self._entries[knowledge_base_id] = (value, n_bytes)
+        self._entries.move_to_end(knowledge_base_id)
+
+        total_bytes = sum(size for _, size in self._entries.values())
+        while total_bytes > self.max_bytes and len(self._entries) > 1:
+            evicted_id, (_, evicted_bytes) = self._entries.popitem(last=False)
+            total_bytes -= evicted_bytes
+            print(f"[DEBUG] Evicted knowledge base '{evicted_id}' from memory ({evicted_bytes} bytes)")
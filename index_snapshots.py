@@ -0,0 +1,148 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: updates are only serialized within a process
+    fcntl = None
+
+# A knowledge base directory holds immutable index snapshots, one directory per
+# version under snapshots/, and a CURRENT file naming the published one:
+#
+#     knowledge/faiss_index_<id>/CURRENT
+#     knowledge/faiss_index_<id>/LOCK
+#     knowledge/faiss_index_<id>/snapshots/<version>/index.faiss, index.pkl, ...
+#
+# A snapshot is written under a temporary name, renamed into place, then published
+# by atomically replacing CURRENT. Readers resolve CURRENT once and read
+# everything from that snapshot, so they never see a partial or mixed index.
+# Indexes saved directly in the knowledge base directory (before snapshots
+# existed) are read as they are until the next save.
+SNAPSHOTS_DIR = "snapshots"
+CURRENT_FILE = "CURRENT"
+LOCK_FILE = "LOCK"
+TMP_PREFIX = ".tmp-"
+# Superseded snapshots are kept at least this long, for other processes still using them
+SNAPSHOT_GC_GRACE_SECONDS = int(os.getenv("SNAPSHOT_GC_GRACE_SECONDS", 60 * 60))
+
+_snapshot_refs = Counter()
+_snapshot_refs_lock = threading.Lock()
+_writer_locks = defaultdict(threading.Lock)
+_writer_locks_lock = threading.Lock()
+
+
+def get_snapshot_path(faiss_index_path):
+    """Returns the directory of the published snapshot (or the legacy index directory)."""
+    try:
+        with open(os.path.join(faiss_index_path, CURRENT_FILE), "r") as f:
+            return os.path.join(faiss_index_path, SNAPSHOTS_DIR, f.read().strip())
+    except FileNotFoundError:
+        return faiss_index_path
+
+
+def new_snapshot_dir(faiss_index_path):
+    """Creates an empty temporary directory to write a snapshot into."""
+    snapshots_dir = os.path.join(faiss_index_path, SNAPSHOTS_DIR)
+    os.makedirs(snapshots_dir, exist_ok=True)
+    return tempfile.mkdtemp(dir=snapshots_dir, prefix=TMP_PREFIX)
+
+
+def publish_snapshot(faiss_index_path, tmp_dir, version):
+    """
+    Moves a fully written snapshot into place and makes it the current one. Both
+    steps are atomic renames: a crash leaves either the previous or the new
+    snapshot published, plus a temporary directory that collect_snapshots removes.
+    """
+    snapshot_path = os.path.join(faiss_index_path, SNAPSHOTS_DIR, version)
+    os.rename(tmp_dir, snapshot_path)
+    current_tmp = os.path.join(faiss_index_path, f"{TMP_PREFIX}{CURRENT_FILE}-{uuid.uuid4().hex}")
+    with open(current_tmp, "w") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(current_tmp, os.path.join(faiss_index_path, CURRENT_FILE))
+    return snapshot_path
+
+
+def pin_snapshot(owner, snapshot_path):
+    """Marks a snapshot as in use for as long as owner (e.g. the loaded store) is alive."""
+    snapshot_path = os.path.abspath(snapshot_path)
+    with _snapshot_refs_lock:
+        _snapshot_refs[snapshot_path] += 1
+    weakref.finalize(owner, _release_snapshot, snapshot_path)
+
+
+def _release_snapshot(snapshot_path):
+    with _snapshot_refs_lock:
+        _snapshot_refs[snapshot_path] -= 1
+        if _snapshot_refs[snapshot_path] <= 0:
+            del _snapshot_refs[snapshot_path]
+
+
+@contextmanager
+def writer_lock(faiss_index_path):
+    """
+    Serializes the updates of one knowledge base across threads and processes
+    (replicas sharing the knowledge directory), so that each update reads the
+    snapshot published by the previous one: an flock on the LOCK file of the
+    knowledge base directory, taken by one thread of the process at a time.
+    """
+    with _writer_locks_lock:
+        thread_lock = _writer_locks[os.path.abspath(faiss_index_path)]
+    with thread_lock:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(faiss_index_path, exist_ok=True)
+        with open(os.path.join(faiss_index_path, LOCK_FILE), "a") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def collect_snapshots(faiss_index_path, grace_seconds=SNAPSHOT_GC_GRACE_SECONDS):
+    """
+    Deletes the snapshots of a knowledge base that are no longer current, are not
+    pinned by this process, and were superseded more than grace_seconds ago, plus
+    leftovers of interrupted saves. Returns the deleted versions.
+    """
+    snapshots_dir = os.path.join(faiss_index_path, SNAPSHOTS_DIR)
+    if not os.path.isdir(snapshots_dir):
+        return []
+    current = os.path.basename(get_snapshot_path(faiss_index_path))
+    now = time.time()
+    removed = []
+
+    entries = [entry for entry in os.scandir(snapshots_dir) if entry.is_dir()]
+    for entry in entries:
+        if entry.name.startswith(TMP_PREFIX) and now - entry.stat().st_mtime > grace_seconds:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+    # A snapshot stopped being current when the next one was created
+    snapshots = sorted(
+        (entry for entry in entries if not entry.name.startswith(TMP_PREFIX)),
+        key=lambda entry: entry.stat().st_mtime,
+    )
+    for position, entry in enumerate(snapshots):
+        if entry.name == current:
+            continue
+        superseded_at = snapshots[position + 1].stat().st_mtime if position + 1 < len(snapshots) else now
+        with _snapshot_refs_lock:
+            pinned = _snapshot_refs.get(os.path.abspath(entry.path), 0) > 0
+        if pinned or now - superseded_at < grace_seconds:
+            continue
+        shutil.rmtree(entry.path, ignore_errors=True)
+        removed.append(entry.name)
+
+    if removed:
+        print(f"[DEBUG] Removed {len(removed)} old index snapshot(s) from {faiss_index_path}")
+    return removed
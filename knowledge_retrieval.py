@@ -1,8 +1,19 @@
 import os
-import fitz  # PyMuPDF for PDF handling
+import json
+import uuid
+import hashlib
+import pickle
+import shutil
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import re
+import faiss
+import docx
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
 from langchain_openai import OpenAIEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
 from langchain.prompts import ChatPromptTemplate, PromptTemplate
 from langchain.schema import Document, StrOutputParser
 from langchain.chains.combine_documents.stuff import StuffDocumentsChain
@@ -10,6 +21,78 @@ from langchain.chains import RetrievalQA
 from langchain.chains.llm import LLMChain
 from langchain_core.runnables import RunnablePassthrough
 from prompt_instructions import get_interview_prompt_hr, get_report_prompt_hr
+from index_registry import KnowledgeIndexRegistry
+from index_snapshots import (
+    get_snapshot_path,
+    new_snapshot_dir,
+    publish_snapshot,
+    pin_snapshot,
+    writer_lock,
+    collect_snapshots,
+)
+from local_embeddings import HashingEmbeddings
+from pdf_extraction import extract_pdf_text, iter_pdf_page_slices
+from chunking import TokenChunker, iter_split_text_slices
+from dedup import deduplicate_texts
+from batch_embeddings import ConcurrentEmbeddings
+from retrievers import BM25Index, HybridRetriever, MMRRetriever
+from faiss_indexes import build_faiss_index, apply_search_params, enable_reconstruction, needs_retraining, remove_vectors
+from qa_cache import TTLCache, CachedRetrievalQA, stream_retrieval_qa
+from token_budget import (
+    count_tokens,
+    record_chat_usage,
+    TokenBudgetRetriever,
+    TokenUsageHandler,
+    CONTEXT_TOKEN_BUDGET,
+)
+from rag_metrics import RAGMetricsHandler, time_query_embeddings
+from settings import embedding_backend, retrieval_mode, faiss_index_type, search_type, mmr_fetch_k, mmr_lambda
+
+KNOWLEDGE_DIR = "knowledge"
+DEFAULT_KNOWLEDGE_BASE_ID = "hr_documents"
+FAISS_INDEX_PATH = os.path.join(KNOWLEDGE_DIR, f"faiss_index_{DEFAULT_KNOWLEDGE_BASE_ID}")
+# Memory budget for the knowledge base indexes kept loaded at the same time
+KNOWLEDGE_INDEX_CACHE_BYTES = int(os.getenv("KNOWLEDGE_INDEX_CACHE_BYTES", 512 * 1024 * 1024))
+EMBEDDING_CACHE_PATH = os.path.join(KNOWLEDGE_DIR, "embedding_cache")
+# Embedding requests are sent concurrently within the API rate limits
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 100))
+EMBEDDING_MAX_WORKERS = int(os.getenv("EMBEDDING_MAX_WORKERS", 4))
+EMBEDDING_REQUESTS_PER_MINUTE = int(os.getenv("EMBEDDING_REQUESTS_PER_MINUTE", 3000))
+EMBEDDING_TOKENS_PER_MINUTE = int(os.getenv("EMBEDDING_TOKENS_PER_MINUTE", 1000000))
+# Answers of the interview/report chains are cached per index version
+QA_CACHE_MAX_ENTRIES = int(os.getenv("QA_CACHE_MAX_ENTRIES", 1024))
+QA_CACHE_TTL_SECONDS = int(os.getenv("QA_CACHE_TTL_SECONDS", 24 * 60 * 60))
+# Transcripts longer than this are summarized segment by segment before the report
+REPORT_MAP_REDUCE_TOKENS = 3000
+REPORT_SEGMENT_TOKENS = 1500
+REPORT_MAX_WORKERS = 4
+# Retrieval context of each generated question, saved with the question set
+QUESTION_CONTEXTS_PATH = "question_contexts.json"
+INDEX_META_FILE = "index_meta.json"
+BM25_INDEX_FILE = "bm25_index.json"
+SUPPORTED_DOCUMENT_EXTENSIONS = (".txt", ".pdf", ".docx")
+# PDFs are parsed and chunked this many pages at a time
+PDF_PAGES_PER_SLICE = 8
+# Chunk size and overlap of the indexed documents, in tokens
+CHUNK_TOKENS = 300
+CHUNK_OVERLAP_TOKENS = 30
+# Chunks at least this similar to an earlier chunk (MinHash estimate of the
+# Jaccard similarity of their word shingles) are not indexed; 0 keeps them all
+CHUNK_DEDUP_THRESHOLD = float(os.getenv("CHUNK_DEDUP_THRESHOLD", 0.9))
+
+# Each knowledge base (e.g. one per role) has its own FAISS index directory
+def get_faiss_index_path(knowledge_base_id=DEFAULT_KNOWLEDGE_BASE_ID):
+    if not re.fullmatch(r"[A-Za-z0-9_-]+", knowledge_base_id):
+        raise RuntimeError(f"Invalid knowledge base ID: '{knowledge_base_id}'")
+    return os.path.join(KNOWLEDGE_DIR, f"faiss_index_{knowledge_base_id}")
+
+def get_index_size(faiss_index_path):
+    faiss_index_path = get_snapshot_path(faiss_index_path)
+    return sum(
+        os.path.getsize(os.path.join(faiss_index_path, file_name))
+        for file_name in ("index.faiss", "index.pkl", BM25_INDEX_FILE)
+        if os.path.exists(os.path.join(faiss_index_path, file_name))
+    )
 
 # Function to load documents based on file type
 def load_document(file_path):
@@ -20,38 +103,346 @@ def load_document(file_path):
         return [Document(page_content=text, metadata={"source": file_path})]
     elif ext == ".pdf":
         try:
-            with fitz.open(file_path) as pdf:
-                text = ""
-                for page in pdf:
-                    text += page.get_text()
-            return [Document(page_content=text, metadata={"source": file_path})]
+            return [Document(page_content=extract_pdf_text(file_path), metadata={"source": file_path})]
         except Exception as e:
             raise RuntimeError(f"Error loading PDF file: {e}")
+    elif ext == ".docx":
+        try:
+            document = docx.Document(file_path)
+            # Paragraphs first, then the text of each table row
+            lines = [paragraph.text for paragraph in document.paragraphs]
+            for table in document.tables:
+                for row in table.rows:
+                    lines.append(" | ".join(cell.text for cell in row.cells))
+            return [Document(page_content="\n".join(lines), metadata={"source": file_path})]
+        except Exception as e:
+            raise RuntimeError(f"Error loading DOCX file: {e}")
     else:
         raise RuntimeError(f"Unsupported file format: {ext}")
 
-# Function to set up knowledge retrieval
-def setup_knowledge_retrieval(llm, language='english', file_path=None):
-    embedding_model = OpenAIEmbeddings()
+# The embedding backend is selected by settings.embedding_backend: "openai" calls
+# the OpenAI API, "local" hashes the text on this machine (no network needed).
+# OpenAI embeddings are cached on disk by chunk content hash, namespaced by the
+# embedding model name, so re-uploading the same (or a slightly edited) document
+# only sends the new chunks to the embedding API.
+def get_embedding_model(backend=None, cache_path=EMBEDDING_CACHE_PATH, progress_callback=None):
+    backend = backend or embedding_backend
+    if backend == "local":
+        return HashingEmbeddings()
+    if backend != "openai":
+        raise RuntimeError(f"Unsupported embedding backend: {backend}")
+
+    # Only the chunks missing from the cache reach the API, in concurrent batches
+    underlying_embeddings = ConcurrentEmbeddings(
+        OpenAIEmbeddings(),
+        batch_size=EMBEDDING_BATCH_SIZE,
+        max_workers=EMBEDDING_MAX_WORKERS,
+        requests_per_minute=EMBEDDING_REQUESTS_PER_MINUTE,
+        tokens_per_minute=EMBEDDING_TOKENS_PER_MINUTE,
+        progress_callback=progress_callback,
+    )
+    embedding_cache = LocalFileStore(cache_path)
+    return CacheBackedEmbeddings.from_bytes_store(
+        underlying_embeddings,
+        embedding_cache,
+        namespace=underlying_embeddings.model,
+    )
+
+# Function to split a document into chunks tagged with its source ID. PDFs are
+# read a few pages at a time and each slice is chunked as soon as it is parsed,
+# so the full text of a large PDF is never held in memory.
+def iter_document_chunks(file_path, source_id):
+    text_splitter = TokenChunker(CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS)
+    if os.path.splitext(file_path)[1].lower() != ".pdf":
+        for document in load_document(file_path):
+            for chunk in text_splitter.split_text(document.page_content):
+                yield Document(page_content=chunk, metadata={**document.metadata, "source_id": source_id})
+        return
+
+    try:
+        for chunk in iter_split_text_slices(iter_pdf_page_slices(file_path, PDF_PAGES_PER_SLICE), text_splitter):
+            yield Document(page_content=chunk, metadata={"source": file_path, "source_id": source_id})
+    except Exception as e:
+        raise RuntimeError(f"Error loading PDF file: {e}")
 
-    if file_path:
-        # Load and split the document
-        documents = load_document(file_path)
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-        texts = text_splitter.split_documents(documents)
+def split_document(file_path, source_id):
+    return list(iter_document_chunks(file_path, source_id))
 
-        # Create a new FAISS index from the document
-        faiss_index_path = "knowledge/faiss_index_hr_documents"
+# Chunk IDs are derived from the source ID and the chunk content, so unchanged
+# chunks keep their ID when a document is re-uploaded.
+def get_chunk_ids(source_id, texts):
+    chunk_ids = []
+    seen = {}
+    for text in texts:
+        digest = hashlib.sha1(text.page_content.encode("utf-8")).hexdigest()
+        occurrence = seen.get(digest, 0)
+        seen[digest] = occurrence + 1
+        chunk_ids.append(f"{source_id}:{digest}:{occurrence}")
+    return chunk_ids
+
+def get_document_chunk_ids(documents_faiss_index, source_id):
+    return [
+        doc_id
+        for doc_id in documents_faiss_index.index_to_docstore_id.values()
+        if documents_faiss_index.docstore.search(doc_id).metadata.get("source_id") == source_id
+    ]
+
+def list_indexed_documents(documents_faiss_index):
+    return sorted({
+        documents_faiss_index.docstore.search(doc_id).metadata.get("source_id")
+        for doc_id in documents_faiss_index.index_to_docstore_id.values()
+    })
+
+# The index metadata records how an index was built (embedding backend, FAISS
+# index type and its build/search parameters), so it is always reopened and
+# updated the same way. Indexes saved before the metadata existed were flat
+# indexes of OpenAI embeddings.
+def load_index_meta(faiss_index_path=FAISS_INDEX_PATH):
+    faiss_index_path = get_snapshot_path(faiss_index_path)
+    index_meta = {"embedding_backend": "openai", "index_type": "flat", "index_params": {}}
+    meta_file = os.path.join(faiss_index_path, INDEX_META_FILE)
+    if os.path.exists(meta_file):
+        with open(meta_file, "r") as f:
+            index_meta.update(json.load(f))
+    return index_meta
+
+# Every save gets a new version ID; indexes saved before versions existed are
+# identified by the modification time of their FAISS file.
+def get_index_version(faiss_index_path=FAISS_INDEX_PATH):
+    faiss_index_path = get_snapshot_path(faiss_index_path)
+    index_meta = load_index_meta(faiss_index_path)
+    if "version" in index_meta:
+        return index_meta["version"]
+    return f"{faiss_index_path}@{os.path.getmtime(os.path.join(faiss_index_path, 'index.faiss'))}"
+
+def load_faiss_index(embedding_model, faiss_index_path=FAISS_INDEX_PATH):
+    faiss_index_path = get_snapshot_path(faiss_index_path)
+    if not os.path.exists(os.path.join(faiss_index_path, "index.faiss")):
+        return None
+    try:
+        documents_faiss_index = FAISS.load_local(faiss_index_path, embedding_model, allow_dangerous_deserialization=True)
+    except Exception as e:
+        raise RuntimeError(f"Error loading FAISS index from {faiss_index_path}: {e}")
+    index_meta = load_index_meta(faiss_index_path)
+    apply_search_params(documents_faiss_index.index, index_meta["index_type"], index_meta["index_params"])
+    return documents_faiss_index
+
+# Opens the persisted index for serving. The FAISS data is memory-mapped where the
+# installed FAISS supports it, so replicas share the page cache and start without
+# reading the whole index into memory. The returned store is read-only: use
+# load_faiss_index for anything that adds or removes documents.
+def load_faiss_index_readonly(embedding_model, faiss_index_path=FAISS_INDEX_PATH):
+    faiss_index_path = get_snapshot_path(faiss_index_path)
+    index_file = os.path.join(faiss_index_path, "index.faiss")
+    if not os.path.exists(index_file):
+        return None
+    mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+    try:
         try:
-            documents_faiss_index = FAISS.from_documents(texts, embedding_model)
-            documents_faiss_index.save_local(faiss_index_path)
-            print(f"New FAISS vector store created and saved at {faiss_index_path}")
-        except Exception as e:
-            raise RuntimeError(f"Error during FAISS index creation: {e}")
-    else:
-        raise RuntimeError("No document provided for knowledge retrieval setup.")
+            index = faiss.read_index(index_file, mmap_flag | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            index = faiss.read_index(index_file)
+        with open(os.path.join(faiss_index_path, "index.pkl"), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+    except Exception as e:
+        raise RuntimeError(f"Error loading FAISS index from {faiss_index_path}: {e}")
+    index_meta = load_index_meta(faiss_index_path)
+    apply_search_params(index, index_meta["index_type"], index_meta["index_params"])
+    # Set up once here: MMR retrieval reads stored vectors back from shared indexes
+    enable_reconstruction(index)
+    return FAISS(embedding_model, index, docstore, index_to_docstore_id)
+
+# The BM25 keyword index is built at ingestion time and saved next to the FAISS
+# index; indexes saved before it existed get one built from their docstore.
+def load_bm25_index(documents_faiss_index, faiss_index_path=FAISS_INDEX_PATH):
+    bm25_path = os.path.join(get_snapshot_path(faiss_index_path), BM25_INDEX_FILE)
+    if os.path.exists(bm25_path):
+        return BM25Index.load(bm25_path)
+    return BM25Index.from_faiss(documents_faiss_index)
+
+# Writes the index as a new immutable snapshot and publishes it (see
+# index_snapshots): readers holding the previous snapshot keep a valid index,
+# and a crash mid-write leaves the previous snapshot published. Returns the
+# directory of the new snapshot.
+def save_faiss_index(documents_faiss_index, faiss_index_path=FAISS_INDEX_PATH, index_meta=None, bm25_index=None):
+    index_meta = dict(index_meta or load_index_meta(faiss_index_path), version=uuid.uuid4().hex)
+    bm25_index = bm25_index or BM25Index.from_faiss(documents_faiss_index)
+    tmp_dir = new_snapshot_dir(faiss_index_path)
+    try:
+        documents_faiss_index.save_local(tmp_dir)
+        bm25_index.save(os.path.join(tmp_dir, BM25_INDEX_FILE))
+        with open(os.path.join(tmp_dir, INDEX_META_FILE), "w") as f:
+            json.dump(index_meta, f, indent=4)
+        snapshot_path = publish_snapshot(faiss_index_path, tmp_dir, index_meta["version"])
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    collect_snapshots(faiss_index_path)
+    return snapshot_path
 
-    documents_retriever = documents_faiss_index.as_retriever()
+# Function to create a FAISS store of the index type recorded in index_meta.
+# The effective build parameters are written back to index_meta["index_params"].
+def create_faiss_index(texts, embedding_model, chunk_ids, index_meta):
+    vectors = np.array(embedding_model.embed_documents([text.page_content for text in texts]), dtype=np.float32)
+    index, index_meta["index_params"] = build_faiss_index(
+        vectors, index_meta["index_type"], index_meta["index_params"]
+    )
+    documents_faiss_index = FAISS(embedding_model, index, InMemoryDocstore(), {})
+    documents_faiss_index.add_embeddings(
+        zip([text.page_content for text in texts], vectors.tolist()),
+        metadatas=[text.metadata for text in texts],
+        ids=chunk_ids,
+    )
+    return documents_faiss_index
+
+def upsert_document(documents_faiss_index, embedding_model, file_path, source_id=None, bm25_index=None,
+                    index_meta=None):
+    """
+    Adds a document to the FAISS index, or replaces the chunks previously indexed
+    under the same source ID. Only chunks whose content changed are removed or
+    embedded, so the cost is proportional to the edit, not to the corpus (except
+    for HNSW indexes, which are rebuilt when chunks are removed; see remove_vectors).
+
+    Args:
+        documents_faiss_index: The FAISS store to update, or None to create a new one.
+        embedding_model: The embedding model used by the store.
+        file_path: Path of the document to index.
+        source_id: Stable ID of the document. Defaults to the file name.
+        bm25_index: Keyword index kept in sync with the store, if any.
+        index_meta: Index type and parameters of the store. Defaults to a flat index.
+
+    Returns:
+        The updated FAISS store.
+    """
+    source_id = source_id or os.path.basename(file_path)
+    texts = split_document(file_path, source_id)
+    return upsert_documents(documents_faiss_index, embedding_model, {source_id: texts}, bm25_index, index_meta)
+
+# Drops near-duplicate chunks (repeated headers, footers, legal text...) across
+# all the documents of an update, keeping the first occurrence.
+def deduplicate_documents(documents, threshold=None):
+    threshold = CHUNK_DEDUP_THRESHOLD if threshold is None else threshold
+    chunks = [(source_id, text) for source_id, texts in documents.items() for text in texts]
+    kept_indices, _ = deduplicate_texts([text.page_content for _, text in chunks], threshold)
+    deduplicated = {source_id: [] for source_id in documents}
+    for index in kept_indices:
+        source_id, text = chunks[index]
+        deduplicated[source_id].append(text)
+    return deduplicated
+
+# Same as upsert_document for several already split documents ({source_id: chunks}).
+# The new chunks of all documents are embedded in a single call, so they are
+# batched together by the embedding model.
+def upsert_documents(documents_faiss_index, embedding_model, documents, bm25_index=None, index_meta=None):
+    index_meta = index_meta if index_meta is not None else {"index_type": "flat", "index_params": {}}
+    documents = deduplicate_documents(documents)
+    new_chunks = []
+    stale_ids = []
+    for source_id, texts in documents.items():
+        chunk_ids = get_chunk_ids(source_id, texts)
+        existing_ids = set()
+        if documents_faiss_index is not None:
+            existing_ids = set(get_document_chunk_ids(documents_faiss_index, source_id))
+        document_stale_ids = existing_ids.difference(chunk_ids)
+        document_new_chunks = [
+            (chunk_id, text) for chunk_id, text in zip(chunk_ids, texts) if chunk_id not in existing_ids
+        ]
+        print(f"[DEBUG] Document '{source_id}': {len(document_new_chunks)} chunks added, "
+              f"{len(document_stale_ids)} removed, {len(texts) - len(document_new_chunks)} unchanged")
+        new_chunks.extend(document_new_chunks)
+        stale_ids.extend(document_stale_ids)
+
+    if bm25_index is not None:
+        for chunk_id in stale_ids:
+            bm25_index.remove(chunk_id, documents_faiss_index.docstore.search(chunk_id).page_content)
+        for chunk_id, text in new_chunks:
+            bm25_index.add(chunk_id, text.page_content)
+
+    if documents_faiss_index is None:
+        print(f"[DEBUG] Creating FAISS index with {len(new_chunks)} chunks from {len(documents)} document(s)")
+        return create_faiss_index(
+            [text for _, text in new_chunks], embedding_model, [chunk_id for chunk_id, _ in new_chunks], index_meta
+        )
+    if stale_ids:
+        remove_vectors(documents_faiss_index, stale_ids, index_meta["index_type"], index_meta["index_params"])
+    if new_chunks:
+        documents_faiss_index.add_documents(
+            [text for _, text in new_chunks], ids=[chunk_id for chunk_id, _ in new_chunks]
+        )
+    return retrain_faiss_index(documents_faiss_index, embedding_model, index_meta)
+
+# IVF-PQ is trained on the chunks the index is first built with (small knowledge
+# bases start flat, see build_faiss_index). Once the store has grown well past
+# them, the index is rebuilt with the default parameters from the stored chunks;
+# their embeddings come from the embedding cache.
+def retrain_faiss_index(documents_faiss_index, embedding_model, index_meta):
+    if not needs_retraining(documents_faiss_index.index, index_meta["index_type"], index_meta["index_params"]):
+        return documents_faiss_index
+    index_to_docstore_id = documents_faiss_index.index_to_docstore_id
+    chunk_ids = [index_to_docstore_id[position] for position in sorted(index_to_docstore_id)]
+    texts = [documents_faiss_index.docstore.search(chunk_id).page_content for chunk_id in chunk_ids]
+    print(f"[INFO] Training the {index_meta['index_type']} index on {len(chunk_ids)} chunks")
+    vectors = np.array(embedding_model.embed_documents(texts), dtype=np.float32)
+    index, index_meta["index_params"] = build_faiss_index(vectors, index_meta["index_type"])
+    index.add(vectors)
+    documents_faiss_index.index = index
+    documents_faiss_index.index_to_docstore_id = dict(enumerate(chunk_ids))
+    return documents_faiss_index
+
+def remove_document(documents_faiss_index, source_id, bm25_index=None, index_meta=None):
+    chunk_ids = get_document_chunk_ids(documents_faiss_index, source_id)
+    if not chunk_ids:
+        raise RuntimeError(f"Document '{source_id}' is not in the knowledge base.")
+    if bm25_index is not None:
+        for chunk_id in chunk_ids:
+            bm25_index.remove(chunk_id, documents_faiss_index.docstore.search(chunk_id).page_content)
+    index_meta = index_meta if index_meta is not None else {"index_type": "flat", "index_params": {}}
+    remove_vectors(documents_faiss_index, chunk_ids, index_meta["index_type"], index_meta["index_params"])
+    print(f"[DEBUG] Document '{source_id}': {len(chunk_ids)} chunks removed")
+    return documents_faiss_index
+
+# Function to delete a document from the persisted FAISS index
+def delete_document_from_knowledge_base(source_id, knowledge_base_id=DEFAULT_KNOWLEDGE_BASE_ID):
+    faiss_index_path = get_faiss_index_path(knowledge_base_id)
+    with writer_lock(faiss_index_path):
+        snapshot_path = get_snapshot_path(faiss_index_path)
+        index_meta = load_index_meta(snapshot_path)
+        embedding_model = get_embedding_model(index_meta["embedding_backend"])
+        documents_faiss_index = load_faiss_index(embedding_model, snapshot_path)
+        if documents_faiss_index is None:
+            raise RuntimeError(f"No FAISS index found at {faiss_index_path}.")
+        bm25_index = load_bm25_index(documents_faiss_index, snapshot_path)
+        remove_document(documents_faiss_index, source_id, bm25_index, index_meta)
+        save_faiss_index(documents_faiss_index, faiss_index_path, index_meta, bm25_index)
+    knowledge_registry.evict(knowledge_base_id)
+    return list_indexed_documents(documents_faiss_index)
+
+qa_cache = TTLCache(max_entries=QA_CACHE_MAX_ENTRIES, ttl_seconds=QA_CACHE_TTL_SECONDS)
+
+# Function to build the interview and report chains on top of a FAISS store.
+# With settings.retrieval_mode "hybrid" and a BM25 index, dense and keyword
+# results are fused; otherwise retrieval is dense only. search_type "mmr"
+# re-ranks the fetch_k best chunks for diversity (see MMRRetriever); the search
+# options default to settings. When the index version is known, both chains
+# answer repeated queries from qa_cache, keyed by the retrieval settings too.
+def build_knowledge_chains(llm, documents_faiss_index, bm25_index=None, index_version=None, search_options=None):
+    search_options = get_search_options(search_options)
+    # Query embedding is timed separately from the index search by RAGMetricsHandler
+    time_query_embeddings(documents_faiss_index)
+    hybrid = retrieval_mode == "hybrid" and bm25_index is not None
+    if search_options["search_type"] == "mmr":
+        documents_retriever = MMRRetriever(
+            vectorstore=documents_faiss_index,
+            bm25_index=bm25_index if hybrid else None,
+            fetch_k=search_options["fetch_k"],
+            lambda_mult=search_options["lambda_mult"],
+        )
+    elif hybrid:
+        documents_retriever = HybridRetriever(vectorstore=documents_faiss_index, bm25_index=bm25_index)
+    else:
+        documents_retriever = documents_faiss_index.as_retriever()
+    # Retrieved context is capped so the "stuff" prompts stay within budget
+    context_retriever = TokenBudgetRetriever(retriever=documents_retriever, max_tokens=CONTEXT_TOKEN_BUDGET)
 
     # Prompt template for the interview
     interview_prompt_template = """
@@ -77,19 +468,253 @@ def setup_knowledge_retrieval(llm, language='english', file_path=None):
     interview_chain = RetrievalQA.from_chain_type(
         llm=llm,
         chain_type="stuff",
-        retriever=documents_retriever,
+        retriever=context_retriever,
         chain_type_kwargs={"prompt": interview_prompt}
     )
 
     report_chain = RetrievalQA.from_chain_type(
         llm=llm,
         chain_type="stuff",
-        retriever=documents_retriever,
+        retriever=context_retriever,
         chain_type_kwargs={"prompt": report_prompt}
     )
 
+    if index_version is not None:
+        model_name = getattr(llm, "model_name", type(llm).__name__)
+        retrieval_settings = json.dumps({**search_options, "hybrid": hybrid}, sort_keys=True)
+        interview_chain = CachedRetrievalQA(interview_chain, qa_cache, index_version, interview_prompt_template,
+                                            model_name, retrieval_settings)
+        report_chain = CachedRetrievalQA(report_chain, qa_cache, index_version, report_prompt_template,
+                                         model_name, retrieval_settings)
+
     return interview_chain, report_chain, documents_retriever
 
+def get_search_options(search_options=None):
+    """Fills in the search options ("search_type", "fetch_k", "lambda_mult") missing from settings."""
+    search_options = {"search_type": search_type, "fetch_k": mmr_fetch_k, "lambda_mult": mmr_lambda,
+                      **(search_options or {})}
+    if search_options["search_type"] not in ("similarity", "mmr"):
+        raise RuntimeError(f"Unsupported search type: {search_options['search_type']}")
+    return search_options
+
+# Chains are built once per process and knowledge base; indexes are opened lazily
+# on first use, so a restart does not need an admin re-upload, and the least
+# recently used ones are dropped from memory when over KNOWLEDGE_INDEX_CACHE_BYTES.
+def _load_knowledge_chains(knowledge_base_id, llm):
+    # Everything is read from the snapshot published at load time; the chains keep
+    # using it (and it is kept on disk) for as long as they are referenced
+    snapshot_path = get_snapshot_path(get_faiss_index_path(knowledge_base_id))
+    index_meta = load_index_meta(snapshot_path)
+    embedding_model = get_embedding_model(index_meta["embedding_backend"])
+    documents_faiss_index = load_faiss_index_readonly(embedding_model, snapshot_path)
+    if documents_faiss_index is None:
+        return None
+    pin_snapshot(documents_faiss_index, snapshot_path)
+    print(f"[DEBUG] FAISS vector store loaded from {snapshot_path}")
+    bm25_index = load_bm25_index(documents_faiss_index, snapshot_path)
+    chains = build_knowledge_chains(llm, documents_faiss_index, bm25_index, get_index_version(snapshot_path),
+                                    index_meta.get("search_options"))
+    return chains, get_index_size(snapshot_path)
+
+knowledge_registry = KnowledgeIndexRegistry(_load_knowledge_chains, KNOWLEDGE_INDEX_CACHE_BYTES)
+
+def get_knowledge_chains(llm, knowledge_base_id=DEFAULT_KNOWLEDGE_BASE_ID):
+    """
+    Returns the (interview_chain, report_chain, retriever) for a knowledge base,
+    loading its index from disk if it is not in memory. Returns (None, None, None)
+    if no index has been saved for it yet.
+    """
+    chains = knowledge_registry.get(knowledge_base_id, llm)
+    if chains is None:
+        return None, None, None
+    return chains
+
+# Function to set up knowledge retrieval. search_options overrides the search
+# settings of the knowledge base, e.g. {"search_type": "mmr", "fetch_k": 30,
+# "lambda_mult": 0.7}; they are saved in its index_meta, so every later load
+# and update of the knowledge base keeps them.
+def setup_knowledge_retrieval(llm, language='english', file_path=None, source_id=None,
+                              knowledge_base_id=DEFAULT_KNOWLEDGE_BASE_ID, progress_callback=None,
+                              search_options=None):
+    if not file_path and search_options is not None:
+        if not os.path.exists(os.path.join(get_snapshot_path(get_faiss_index_path(knowledge_base_id)), "index.faiss")):
+            raise RuntimeError("No document provided for knowledge retrieval setup.")
+        # Saving the options publishes a new snapshot of the unchanged documents
+        def keep_documents(documents_faiss_index, embedding_model, bm25_index, index_meta):
+            return documents_faiss_index
+
+        return update_knowledge_base(llm, knowledge_base_id, keep_documents, progress_callback, search_options)
+
+    if not file_path:
+        # Reuse the index saved by a previous upload
+        interview_chain, report_chain, documents_retriever = get_knowledge_chains(llm, knowledge_base_id)
+        if interview_chain is None:
+            raise RuntimeError("No document provided for knowledge retrieval setup.")
+        return interview_chain, report_chain, documents_retriever
+
+    # Add the document to the persisted FAISS index, replacing any previous
+    # version uploaded under the same source ID
+    def add_document(documents_faiss_index, embedding_model, bm25_index, index_meta):
+        return upsert_document(documents_faiss_index, embedding_model, file_path, source_id, bm25_index, index_meta)
+
+    return update_knowledge_base(llm, knowledge_base_id, add_document, progress_callback, search_options)
+
+# Opens the persisted index of a knowledge base for writing, applies update to
+# it, saves it and publishes the new chains in the registry.
+# update(documents_faiss_index, embedding_model, bm25_index, index_meta) returns
+# the updated store; documents_faiss_index is None for a new knowledge base.
+# search_options, if given, are merged into the ones saved in index_meta.
+def update_knowledge_base(llm, knowledge_base_id, update, progress_callback=None, search_options=None):
+    faiss_index_path = get_faiss_index_path(knowledge_base_id)
+    embedding_model = get_embedding_model(progress_callback=progress_callback)
+    # Updates of the same knowledge base are serialized so none is lost; interviews
+    # keep reading the snapshot they loaded while the new one is written
+    with writer_lock(faiss_index_path):
+        snapshot_path = get_snapshot_path(faiss_index_path)
+        index_meta = {"embedding_backend": embedding_backend, "index_type": faiss_index_type, "index_params": {}}
+        if os.path.exists(os.path.join(snapshot_path, "index.faiss")):
+            index_meta = load_index_meta(snapshot_path)
+            if index_meta["embedding_backend"] != embedding_backend:
+                raise RuntimeError(
+                    f"The knowledge base '{knowledge_base_id}' was built with the '{index_meta['embedding_backend']}' "
+                    f"embedding backend, but '{embedding_backend}' is configured. Delete {faiss_index_path} to rebuild it."
+                )
+            if index_meta["index_type"] != faiss_index_type:
+                print(f"[WARNING] Knowledge base '{knowledge_base_id}' keeps its '{index_meta['index_type']}' index; "
+                      f"delete {faiss_index_path} to rebuild it as '{faiss_index_type}'.")
+
+        if search_options is not None:
+            index_meta["search_options"] = {**index_meta.get("search_options", {}), **search_options}
+            get_search_options(index_meta["search_options"])
+
+        try:
+            documents_faiss_index = load_faiss_index(embedding_model, snapshot_path)
+            bm25_index = BM25Index() if documents_faiss_index is None else load_bm25_index(documents_faiss_index, snapshot_path)
+            documents_faiss_index = update(documents_faiss_index, embedding_model, bm25_index, index_meta)
+            snapshot_path = save_faiss_index(documents_faiss_index, faiss_index_path, index_meta, bm25_index)
+            print(f"FAISS vector store updated and saved at {snapshot_path}")
+            # The updated store is served by the chains built below
+            enable_reconstruction(documents_faiss_index.index)
+        except Exception as e:
+            raise RuntimeError(f"Error during FAISS index creation: {e}")
+
+    chains = build_knowledge_chains(llm, documents_faiss_index, bm25_index, get_index_version(snapshot_path),
+                                    index_meta.get("search_options"))
+    knowledge_registry.put(knowledge_base_id, chains, get_index_size(snapshot_path))
+    return chains
+
+# Lists the supported documents of a folder (recursively) or of a list of paths.
+# Documents found in a folder are identified by their path relative to it, other
+# documents by their file name.
+def find_documents(paths):
+    if isinstance(paths, str):
+        paths = [paths]
+    documents = {}
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, file_names in os.walk(path):
+                for file_name in sorted(file_names):
+                    if os.path.splitext(file_name)[1].lower() in SUPPORTED_DOCUMENT_EXTENSIONS:
+                        file_path = os.path.join(root, file_name)
+                        source_id = os.path.relpath(file_path, path).replace(os.sep, "/")
+                        documents.setdefault(source_id, []).append(file_path)
+        else:
+            documents.setdefault(os.path.basename(path), []).append(path)
+
+    duplicates = sorted(source_id for source_id, file_paths in documents.items() if len(file_paths) > 1)
+    if duplicates:
+        raise RuntimeError(f"Several documents have the same source ID: {', '.join(duplicates)}")
+    return {source_id: file_paths[0] for source_id, file_paths in sorted(documents.items())}
+
+def _split_document_safe(file_path, source_id):
+    try:
+        return split_document(file_path, source_id), None
+    except Exception as e:
+        return None, str(e)
+
+def ingest_documents(llm, paths, knowledge_base_id=DEFAULT_KNOWLEDGE_BASE_ID, max_workers=None,
+                     progress_callback=None):
+    """
+    Adds a folder or a list of documents (txt, pdf, docx) to a knowledge base in
+    one update. Documents are loaded and split in a process pool, one document
+    per task, then all their new chunks are embedded together and added to the
+    index. A document that cannot be read is reported and skipped.
+
+    Args:
+        llm: The model used by the interview and report chains.
+        paths: A folder, a file path, or a list of folders and file paths.
+        knowledge_base_id: The knowledge base to update.
+        max_workers: Number of extraction processes. Defaults to the number of CPUs.
+        progress_callback: Called with (done, total) as chunks are embedded.
+
+    Returns:
+        The (interview_chain, report_chain, documents_retriever) of the knowledge base.
+    """
+    documents = find_documents(paths)
+    if not documents:
+        raise RuntimeError("No supported documents (txt, pdf, docx) to ingest.")
+
+    source_ids = list(documents)
+    file_paths = [documents[source_id] for source_id in source_ids]
+    if len(documents) == 1:
+        results = [_split_document_safe(file_paths[0], source_ids[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(_split_document_safe, file_paths, source_ids))
+
+    split_documents = {}
+    for source_id, (texts, error) in zip(source_ids, results):
+        if error is not None:
+            print(f"[ERROR] Skipping document '{source_id}': {error}")
+        else:
+            split_documents[source_id] = texts
+    if not split_documents:
+        raise RuntimeError("None of the documents could be loaded.")
+    print(f"[INFO] Extracted {len(split_documents)}/{len(documents)} documents "
+          f"({sum(len(texts) for texts in split_documents.values())} chunks)")
+
+    def add_documents(documents_faiss_index, embedding_model, bm25_index, index_meta):
+        return upsert_documents(documents_faiss_index, embedding_model, split_documents, bm25_index, index_meta)
+
+    return update_knowledge_base(llm, knowledge_base_id, add_documents, progress_callback)
+
+# Interview questions are known before the interview, so their retrieval context
+# is fetched once, when the question set is generated, and saved next to it.
+# During the interview the context is read from the file: no vector search per turn.
+def precompute_question_contexts(questions, documents_retriever, knowledge_base_id=None):
+    context_retriever = TokenBudgetRetriever(retriever=documents_retriever, max_tokens=CONTEXT_TOKEN_BUDGET)
+    results = context_retriever.batch(list(questions))
+    return {
+        "index_version": get_index_version(get_faiss_index_path(knowledge_base_id)) if knowledge_base_id else None,
+        "contexts": [
+            {"question": question, "context": [document.page_content for document in documents]}
+            for question, documents in zip(questions, results)
+        ],
+    }
+
+def save_question_contexts(question_contexts, path=QUESTION_CONTEXTS_PATH):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(question_contexts, f, indent=4)
+    print(f"[DEBUG] Context of {len(question_contexts['contexts'])} questions saved at {path}")
+
+# Returns {question: [context snippets]}, empty if no contexts were saved
+def load_question_contexts(path=QUESTION_CONTEXTS_PATH, knowledge_base_id=None):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            question_contexts = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"[WARNING] Could not read the question contexts at {path}: {e}")
+        return {}
+
+    if knowledge_base_id is not None and question_contexts.get("index_version") is not None:
+        faiss_index_path = get_faiss_index_path(knowledge_base_id)
+        if os.path.exists(faiss_index_path) and question_contexts["index_version"] != get_index_version(faiss_index_path):
+            print(f"[WARNING] The question contexts at {path} were computed on an older version of the "
+                  f"'{knowledge_base_id}' knowledge base.")
+    return {entry["question"]: entry["context"] for entry in question_contexts.get("contexts", [])}
+
 def get_next_response(interview_chain, message, history, question_count):
     if question_count >= 5:
         return "Thank you for your responses. I will now prepare a report."
@@ -97,13 +722,75 @@ def get_next_response(interview_chain, message, history, question_count):
     if not interview_chain:
         return "Error: Knowledge base not loaded. Please contact an admin."
 
+    config = {"callbacks": [TokenUsageHandler("interview_chain"), RAGMetricsHandler("interview_chain")]}
     # Generate the next question using RetrievalQA
-    response = interview_chain.invoke({"query": message})
+    response = interview_chain.invoke({"query": message}, config=config)
     next_question = response.get("result", "Could you provide more details on that?")
 
     return next_question
 
-def generate_report(report_chain, history, language):
+# Same as get_next_response, but yields the response as it is generated
+# (the full text so far on every yield, ready to be shown in the chat)
+def stream_next_response(interview_chain, message, history, question_count):
+    if question_count >= 5:
+        yield "Thank you for your responses. I will now prepare a report."
+        return
+
+    if not interview_chain:
+        yield "Error: Knowledge base not loaded. Please contact an admin."
+        return
+
+    config = {"callbacks": [TokenUsageHandler("interview_chain"), RAGMetricsHandler("interview_chain")]}
+    if isinstance(interview_chain, CachedRetrievalQA):
+        chunks = interview_chain.stream({"query": message}, config=config)
+    else:
+        chunks = stream_retrieval_qa(interview_chain, message, config=config)
+
+    next_question = ""
+    for chunk in chunks:
+        next_question += chunk
+        yield next_question
+
+    if not next_question:
+        yield "Could you provide more details on that?"
+
+# Function to split the interview history into segments of at most max_tokens
+# (a single longer message gets a segment of its own)
+def split_history_into_segments(history, max_tokens=REPORT_SEGMENT_TOKENS):
+    segments = []
+    current_segment = []
+    current_tokens = 0
+    for message in history:
+        message_tokens = count_tokens(message)
+        if current_segment and current_tokens + message_tokens > max_tokens:
+            segments.append("\n".join(current_segment))
+            current_segment = []
+            current_tokens = 0
+        current_segment.append(message)
+        current_tokens += message_tokens
+    if current_segment:
+        segments.append("\n".join(current_segment))
+    return segments
+
+def summarize_interview_segment(llm, segment, language):
+    prompt = (
+        f"Summarize this part of an HR interview in {language}. Keep every fact the candidate "
+        f"gave about their experience, skills and motivation, and note how they communicated.\n\n{segment}"
+    )
+    result = llm.invoke(prompt, config={"callbacks": [RAGMetricsHandler("report_segment_summary")]})
+    record_chat_usage("report_segment_summary", getattr(llm, "model_name", "unknown"), prompt, result)
+    return getattr(result, "content", result).strip()
+
+def generate_report_stream(report_chain, history, language):
+    """
+    Generates the HR report, yielding partial output while it is being produced.
+
+    Short transcripts are sent to the report chain in one request. Longer ones
+    (over REPORT_MAP_REDUCE_TOKENS) are split into segments that are summarized in
+    parallel (map), and the report is then written from the summaries (reduce), so
+    the report latency does not grow with the interview length. Each yield is the
+    text produced so far; the last one is the final report.
+    """
     combined_history = "\n".join(history)
 
     # If report_chain is not available, return a fallback report
@@ -117,18 +804,45 @@ def generate_report(report_chain, history, language):
         Assessment:
         Based on the responses, the candidate's strengths, areas for improvement, and overall fit for the role have been noted. No additional knowledge-based insights due to missing vector database.
         """
-        return fallback_report
+        yield fallback_report
+        return
+
+    if count_tokens(combined_history) > REPORT_MAP_REDUCE_TOKENS:
+        segments = split_history_into_segments(history)
+        print(f"[DEBUG] Summarizing the interview in {len(segments)} segments before the report")
+        llm = report_chain.combine_documents_chain.llm_chain.llm
+        summaries = []
+        with ThreadPoolExecutor(max_workers=REPORT_MAX_WORKERS) as executor:
+            futures = [executor.submit(summarize_interview_segment, llm, segment, language) for segment in segments]
+            for future in futures:
+                summaries.append(future.result())
+                yield "\n\n".join(
+                    f"Interview part {n + 1} of {len(segments)}:\n{summary}" for n, summary in enumerate(summaries)
+                )
+        combined_history = "\n".join(summaries)
 
     # Generate report using the retrieval chain
-    result = report_chain.invoke({"query": f"Please provide an HR report based on the interview in {language}. Interview history: {combined_history}"})
+    result = report_chain.invoke(
+        {"query": f"Please provide an HR report based on the interview in {language}. Interview history: {combined_history}"},
+        config={"callbacks": [TokenUsageHandler("report_chain"), RAGMetricsHandler("report_chain")]},
+    )
 
-    return result.get("result", "Unable to generate report due to insufficient information.")
+    yield result.get("result", "Unable to generate report due to insufficient information.")
+
+def generate_report(report_chain, history, language):
+    report = None
+    for report in generate_report_stream(report_chain, history, language):
+        pass
+    return report
 
 def get_initial_question(interview_chain):
     if not interview_chain:
         return "Please introduce yourself and tell me a little bit about your professional background."
 
-    result = interview_chain.invoke({"query": "What should be the first question in an HR interview?"})
+    result = interview_chain.invoke(
+        {"query": "What should be the first question in an HR interview?"},
+        config={"callbacks": [TokenUsageHandler("interview_chain"), RAGMetricsHandler("interview_chain")]},
+    )
     return result.get("result", "Could you tell me a little bit about yourself and your professional background?")
 
 
@@ -0,0 +1,41 @@
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from sklearn.feature_extraction.text import HashingVectorizer
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Fully local embedding backend based on scikit-learn's HashingVectorizer.
+
+    Word unigrams and bigrams are hashed into a fixed number of features and the
+    vectors are L2-normalised, so no vocabulary has to be fitted or stored: the same
+    text always maps to the same vector, and a persisted FAISS index stays valid
+    across processes. Texts are vectorised in NumPy batches.
+    """
+
+    def __init__(self, n_features=1024, ngram_range=(1, 2), batch_size=256):
+        self.n_features = n_features
+        self.batch_size = batch_size
+        self.vectorizer = HashingVectorizer(
+            n_features=n_features,
+            ngram_range=ngram_range,
+            alternate_sign=False,
+            norm="l2",
+            dtype=np.float32,
+        )
+
+    @property
+    def model(self):
+        return f"local-hashing-{self.n_features}"
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        batches = [
+            self.vectorizer.transform(texts[start:start + self.batch_size]).toarray()
+            for start in range(0, len(texts), self.batch_size)
+        ]
+        return np.vstack(batches).tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
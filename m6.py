@@ -5,6 +5,7 @@ from dotenv import load_dotenv
 import gradio as gr
 from langchain_openai import ChatOpenAI
 from langchain.schema import HumanMessage, SystemMessage
+from token_budget import fit_history, truncate_to_tokens, record_chat_usage, HISTORY_TOKEN_BUDGET, USER_INPUT_TOKEN_BUDGET
 from openai import OpenAI
 import tempfile
 import time
@@ -68,8 +69,9 @@ def conduct_interview(questions, language="English", history_limit=5):
     if not openai_api_key:
         raise RuntimeError("OpenAI API key not found. Please add it to your .env file as OPENAI_API_KEY.")
 
+    model = "gpt-4o"
     chat = ChatOpenAI(
-        openai_api_key=openai_api_key, model="gpt-4o", temperature=0.7, max_tokens=750
+        openai_api_key=openai_api_key, model=model, temperature=0.7, max_tokens=750
     )
 
     conversation_history = deque(maxlen=history_limit)
@@ -100,16 +102,21 @@ def conduct_interview(questions, language="English", history_limit=5):
         if user_input.lower() in ["exit", "quit"]:
             history.append({"role": "assistant", "content": "The interview has ended at your request. Thank you for your time!"})
             is_interview_finished = True
-            return history, "", None
+            yield history, "", None
+            return
 
         # If interview is finished, do nothing
         if is_interview_finished:
-            return history, "", None
+            yield history, "", None
+            return
         
         question_text = questions[current_question_index[0]]
-        history_content = "\n".join([f"Q: {entry['question']}\nA: {entry['answer']}" for entry in conversation_history])
+        # Keep the prompt within budget: most recent history first, long inputs cut
+        history_content = "\n".join(fit_history([f"Q: {entry['question']}\nA: {entry['answer']}" for entry in conversation_history],
+                                                HISTORY_TOKEN_BUDGET, model))
+        prompt_input = truncate_to_tokens(user_input, USER_INPUT_TOKEN_BUDGET, model)
         combined_prompt = (f"{system_prompt}\n\nPrevious conversation history:\n{history_content}\n\n"
-                           f"Current question: {question_text}\nUser's input: {user_input}\n\n"
+                           f"Current question: {question_text}\nUser's input: {prompt_input}\n\n"
                            "Respond in a warm and conversational way, offering natural follow-ups if needed.")
 
         messages = [
@@ -117,28 +124,32 @@ def conduct_interview(questions, language="English", history_limit=5):
             HumanMessage(content=combined_prompt)
         ]
 
+        # Stream the response into the chat; only the next question is spoken
+        history.append({"role": "user", "content": user_input})
+        history.append({"role": "assistant", "content": ""})
         chat_start_time = time.time()
-        response = chat.invoke(messages)
+        response = None
+        for chunk in chat.stream(messages):
+            if response is None:
+                print(f"DEBUG - Chat time to first token: {time.time() - chat_start_time:.2f} seconds")
+            response = chunk if response is None else response + chunk
+            history[-1]["content"] = response.content
+            yield history, "", gr.update()
         print(f"DEBUG - Chat response time: {time.time() - chat_start_time:.2f} seconds")
-        response_content = response.content.strip()
-
-        # Convert response to speech
-        audio_file_path = convert_text_to_speech(response_content)
+        record_chat_usage("interview_step", model, system_prompt + combined_prompt, response)
+        response_content = response.content.strip() if response else ""
+        history[-1]["content"] = response_content
 
         conversation_history.append({"question": question_text, "answer": user_input})
         interview_data.append({"question": question_text, "answer": user_input})
 
-        # Use the correct format for messages
-        history.append({"role": "user", "content": user_input})
-        history.append({"role": "assistant", "content": response_content})
-
         if current_question_index[0] + 1 < len(questions):
             current_question_index[0] += 1
             next_question = f"Alright, let's move on. {questions[current_question_index[0]]}"
             next_question_audio_path = convert_text_to_speech(next_question)
             history.append({"role": "assistant", "content": next_question})
             print(f"DEBUG - Interview step time: {time.time() - step_start_time:.2f} seconds")
-            return history, "", next_question_audio_path
+            yield history, "", next_question_audio_path
         
         else:
             # Convert final message to speech and play it
@@ -149,7 +160,7 @@ def conduct_interview(questions, language="English", history_limit=5):
             last_question_audio_path = convert_text_to_speech(questions[current_question_index[0]])
             is_interview_finished = True
             print(f"DEBUG - Interview step time: {time.time() - step_start_time:.2f} seconds")
-            return history, "", last_question_audio_path
+            yield history, "", last_question_audio_path
 
     return interview_step, initial_message, final_message
 
@@ -219,16 +230,15 @@ def main():
                 return [], "", None
 
             def interview_step_wrapper(user_response, audio_response, history):
-                history, _, audio_path = interview_func(user_response, audio_response, history)
-                time.sleep(0.1)  # Reduced delay
-                return history, "", audio_path
+                # interview_func is a generator: forward every partial update to the chat
+                for history, _, audio_path in interview_func(user_response, audio_response, history):
+                    yield history, "", audio_path
 
             def on_enter_submit(history, user_response):
                 if not user_response.strip():
-                    return history, "", None
-                history, _, audio_path = interview_step_wrapper(user_response, None, history)
-                time.sleep(0.1)  # Reduced delay
-                return history, "", audio_path
+                    yield history, "", None
+                    return
+                yield from interview_step_wrapper(user_response, None, history)
 
             audio_input.stop_recording(interview_step_wrapper, inputs=[user_input, audio_input, chatbot], outputs=[chatbot, user_input, audio_output])
             start_btn.click(start_interview, inputs=[], outputs=[chatbot, user_input, audio_output])
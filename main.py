@@ -30,8 +30,12 @@ from splitgpt import (
 from ai_config import convert_text_to_speech, load_model  # Placeholder, needs implementation
 from knowledge_retrieval import (
     setup_knowledge_retrieval,
-    get_next_response,
-    generate_report,
+    get_knowledge_chains,
+    DEFAULT_KNOWLEDGE_BASE_ID,
+    stream_next_response,
+    precompute_question_contexts,
+    save_question_contexts,
+    generate_report_stream,
     get_initial_question,
 )  # Placeholder, needs implementation
 from prompt_instructions import (
@@ -42,11 +46,23 @@ from settings import language  # Placeholder, needs implementation
 from utils import save_interview_history  # Placeholder, needs implementation
 
 
+def load_knowledge_chains(knowledge_base_id=DEFAULT_KNOWLEDGE_BASE_ID):
+    # Opens the knowledge base saved by a previous upload (kept in memory per process)
+    try:
+        interview_chain, report_chain, _ = get_knowledge_chains(
+            load_model(os.getenv("OPENAI_API_KEY")), knowledge_base_id
+        )
+    except Exception as e:
+        print(f"[ERROR] Failed to load knowledge base: {e}")
+        return None, None
+    return interview_chain, report_chain
+
+
 class InterviewState:
     def __init__(self):
         self.reset()
 
-    def reset(self, voice="alloy"):
+    def reset(self, voice="alloy", knowledge_base_id=DEFAULT_KNOWLEDGE_BASE_ID):
         self.question_count = 0
         self.interview_history = []
         self.selected_interviewer = voice
@@ -56,9 +72,9 @@ class InterviewState:
         self.initial_audio_path = None
         self.admin_authenticated = False
         self.document_loaded = False
-        self.knowledge_retrieval_setup = False
-        self.interview_chain = None
-        self.report_chain = None
+        self.knowledge_base_id = knowledge_base_id
+        self.interview_chain, self.report_chain = load_knowledge_chains(knowledge_base_id)
+        self.knowledge_retrieval_setup = self.interview_chain is not None
         self.current_questions = [] # Store the current set of questions
 
     def get_voice_setting(self):
@@ -69,7 +85,8 @@ interview_state = InterviewState()
 
 
 def reset_interview_action(voice):
-    interview_state.reset(voice)
+    # The next candidate is interviewed on the knowledge base loaded by the admin
+    interview_state.reset(voice, interview_state.knowledge_base_id)
     n_of_questions = 5  # Default questions
     print(f"[DEBUG] Interview reset. Voice: {voice}")
 
@@ -137,13 +154,19 @@ def bot_response(chatbot, message):
 
     if interview_state.question_count == 1:
         response = get_initial_question(interview_state.interview_chain)
+        chatbot.append({"role": "assistant", "content": response})
     else:
-        response = get_next_response(
+        # Show the response as it is generated; the audio follows once it is complete
+        chatbot.append({"role": "assistant", "content": ""})
+        response = ""
+        for response in stream_next_response(
             interview_state.interview_chain,
             message["content"],
             [msg["content"] for msg in chatbot if msg.get("role") == "user"],
             interview_state.question_count,
-        )
+        ):
+            chatbot[-1]["content"] = response
+            yield chatbot, gr.update()
 
     # Generate and save the bot's audio response
     audio_buffer = BytesIO()
@@ -154,7 +177,6 @@ def bot_response(chatbot, message):
         temp_file.write(audio_buffer.getvalue())
 
     interview_state.temp_audio_files.append(temp_audio_path)
-    chatbot.append({"role": "assistant", "content": response})
 
     # Check if the interview is finished
     if interview_state.question_count >= n_of_questions:
@@ -175,26 +197,28 @@ def bot_response(chatbot, message):
         # Append conclusion message to chatbot history
         chatbot.append({"role": "system", "content": conclusion_message})
 
-        # Generate the HR report content
-        report_content = generate_report(
-            interview_state.report_chain,
-            [msg["content"] for msg in chatbot],
-            language,
-        )
+        # Generate the HR report content, showing the partial output (e.g. the
+        # summaries of the interview parts) in the chat while it is produced
+        transcript = [msg["content"] for msg in chatbot]
+        chatbot.append({"role": "assistant", "content": "📝 Preparing your report..."})
+        report_content = None
+        for report_content in generate_report_stream(interview_state.report_chain, transcript, language):
+            chatbot[-1]["content"] = f"📝 Preparing your report...\n\n{report_content}"
+            yield chatbot, gr.update()
+        chatbot[-1]["content"] = "📝 Your report is ready."
 
         # Save the interview history
-        txt_path = save_interview_history(
-            [msg["content"] for msg in chatbot], language
-        )
+        txt_path = save_interview_history(transcript, language)
         print(f"[DEBUG] Interview history saved at: {txt_path}")
 
         # Save the report to the reports folder
         report_file_path = store_interview_report(report_content)
         print(f"[DEBUG] Interview report saved at: {report_file_path}")
 
-        return chatbot, gr.File(visible=True, value=txt_path), gr.Audio(value=temp_conclusion_audio_path, autoplay=True)
+        yield chatbot, gr.File(visible=True, value=txt_path), gr.Audio(value=temp_conclusion_audio_path, autoplay=True)
+        return
 
-    return chatbot, gr.Audio(value=temp_audio_path, autoplay=True)
+    yield chatbot, gr.Audio(value=temp_audio_path, autoplay=True)
 
 
 # --- Candidate Interview Implementation ---
@@ -225,9 +249,10 @@ from langchain.schema import HumanMessage, SystemMessage
 
 # Placeholder imports (ensure these are correctly implemented)
 from ai_config import convert_text_to_speech  # For text-to-speech
-from knowledge_retrieval import generate_report  # For report generation
+from knowledge_retrieval import generate_report_stream, load_question_contexts  # For report generation
 from utils import save_interview_history  # For saving interview history
 from settings import language # Placeholder, needs implementation
+from token_budget import fit_history, truncate_to_tokens, record_chat_usage, HISTORY_TOKEN_BUDGET, USER_INPUT_TOKEN_BUDGET
 
 # Assuming you have interview_state defined elsewhere and accessible here
 # interview_state = InterviewState() # You might need to initialize this or pass it as a parameter
@@ -239,8 +264,9 @@ def conduct_interview(questions, language="English", history_limit=5):
             "OpenAI API key not found. Please add it to your .env file as OPENAI_API_KEY."
         )
 
+    model = "gpt-4"
     chat = ChatOpenAI(
-        openai_api_key=openai_api_key, model="gpt-4", temperature=0.7, max_tokens=750
+        openai_api_key=openai_api_key, model=model, temperature=0.7, max_tokens=750
     )
 
     conversation_history = deque(maxlen=history_limit)
@@ -251,6 +277,8 @@ def conduct_interview(questions, language="English", history_limit=5):
 
     interview_data = []
     current_question_index = [0]
+    # Knowledge base context retrieved for each question when the set was generated
+    question_contexts = load_question_contexts(knowledge_base_id=interview_state.knowledge_base_id)
 
     initial_message = (
         "👋 Hi there, I'm Sarah, your friendly AI HR assistant! "
@@ -267,18 +295,28 @@ def conduct_interview(questions, language="English", history_limit=5):
                     "content": "The interview has ended at your request. Thank you for your time!",
                 }
             )
-            return history, ""
+            yield history, ""
+            return
 
         question_text = questions[current_question_index[0]]
+        # Keep the prompt within budget: most recent history first, long inputs cut
         history_content = "\n".join(
-            [
-                f"Q: {entry['question']}\nA: {entry['answer']}"
-                for entry in conversation_history
-            ]
+            fit_history(
+                [
+                    f"Q: {entry['question']}\nA: {entry['answer']}"
+                    for entry in conversation_history
+                ],
+                HISTORY_TOKEN_BUDGET,
+                model,
+            )
         )
+        prompt_input = truncate_to_tokens(user_input, USER_INPUT_TOKEN_BUDGET, model)
+        context = "\n\n".join(question_contexts.get(question_text, []))
+        context_content = f"Relevant knowledge base context:\n{context}\n\n" if context else ""
         combined_prompt = (
             f"{system_prompt}\n\nPrevious conversation history:\n{history_content}\n\n"
-            f"Current question: {question_text}\nUser's input: {user_input}\n\n"
+            f"{context_content}"
+            f"Current question: {question_text}\nUser's input: {prompt_input}\n\n"
             "Respond in a warm and conversational way, offering natural follow-ups if needed."
         )
 
@@ -287,8 +325,17 @@ def conduct_interview(questions, language="English", history_limit=5):
             HumanMessage(content=combined_prompt),
         ]
 
-        response = chat.invoke(messages)
-        response_content = response.content.strip()
+        # Stream the response into the chat so the candidate sees it as it is generated
+        history.append({"role": "user", "content": user_input})
+        history.append({"role": "assistant", "content": ""})
+        response = None
+        for chunk in chat.stream(messages):
+            response = chunk if response is None else response + chunk
+            history[-1]["content"] = response.content
+            yield history, ""
+        record_chat_usage("interview_step", model, system_prompt + combined_prompt, response)
+        response_content = response.content.strip() if response else ""
+        history[-1]["content"] = response_content
 
         # --- Integrated bot_response functionality starts here ---
 
@@ -309,8 +356,7 @@ def conduct_interview(questions, language="English", history_limit=5):
 
         conversation_history.append({"question": question_text, "answer": user_input})
         interview_data.append({"question": question_text, "answer": user_input})
-        history.append({"role": "user", "content": user_input})
-        history.append({"role": "assistant", "content": response_content, "audio": temp_audio_path}) # Store audio path
+        history[-1]["audio"] = temp_audio_path # Store audio path
 
         if current_question_index[0] + 1 < len(questions):
             current_question_index[0] += 1
@@ -326,24 +372,25 @@ def conduct_interview(questions, language="English", history_limit=5):
             # --- Generate report and save history (only at the end) ---
             interview_state.interview_finished = True
 
-            # Generate the HR report content
-            report_content = generate_report(
-                interview_state.report_chain,
-                [msg["content"] for msg in history if msg["role"] != "system"], # Consider only user/assistant messages
-                language,
-            )
+            # Generate the HR report content, showing the partial output (e.g. the
+            # summaries of the interview parts) in the chat while it is produced
+            transcript = [msg["content"] for msg in history if msg["role"] != "system"] # Consider only user/assistant messages
+            history.append({"role": "assistant", "content": "📝 Preparing your report..."})
+            report_content = None
+            for report_content in generate_report_stream(interview_state.report_chain, transcript, language):
+                history[-1]["content"] = f"📝 Preparing your report...\n\n{report_content}"
+                yield history, ""
+            history[-1]["content"] = "📝 Your report is ready."
 
             # Save the interview history
-            txt_path = save_interview_history(
-                [msg["content"] for msg in history if msg["role"] != "system"], language # Consider only user/assistant messages
-            )
+            txt_path = save_interview_history(transcript, language)
             print(f"[DEBUG] Interview history saved at: {txt_path}")
 
             # Save the report to the reports folder
             report_file_path = store_interview_report(report_content)
             print(f"[DEBUG] Interview report saved at: {report_file_path}")
 
-        return history, ""
+        yield history, ""
 
     return interview_step, initial_message
 
@@ -364,14 +411,16 @@ def launch_candidate_app():
 
     def clear_interview_ui():
         # Reset state when clearing the interview
-        interview_state.reset()
+        interview_state.reset(knowledge_base_id=interview_state.knowledge_base_id)
         return [], ""
 
     def on_enter_submit_ui(history, user_response):
         if not user_response.strip():
-            return history, ""
-        history, _ = interview_state.interview_func(user_response, history)
-        return history, ""
+            yield history, ""
+            return
+        # interview_func is a generator: forward every partial update to the chat
+        for history, _ in interview_state.interview_func(user_response, history):
+            yield history, ""
 
     with gr.Blocks(title="AI HR Interview Assistant") as candidate_app:
         gr.Markdown("<h1 style='text-align: center;'>👋 Welcome to Your AI HR Interview Assistant</h1>")
@@ -497,19 +546,37 @@ def create_manager_app():
                 gr.Markdown("### 📄 Upload PDF for Question Generation")
                 pdf_file_input = gr.File(label="Upload PDF File", type="filepath")
                 num_questions_pdf_input = gr.Number(label="Number of Questions", value=5, precision=0)
+                force_regenerate_input = gr.Checkbox(label="Force regenerate (ignore cached questions)", value=False)
                 
                 pdf_status_output = gr.Textbox(label="Status", lines=3)
                 pdf_question_output = gr.JSON(label="Generated Questions")
                 
                 generate_pdf_button = gr.Button("Generate Questions from PDF")
 
-                def update_pdf_ui(pdf_path, num_questions):
-                    for status, questions in generate_and_save_questions_from_pdf3(pdf_path, num_questions):
+                def update_pdf_ui(pdf_path, num_questions, force_regenerate):
+                    for status, questions in generate_and_save_questions_from_pdf3(
+                        pdf_path, num_questions, force_regenerate=force_regenerate
+                    ):
                         yield gr.update(value=status), gr.update(value=questions)
 
+                    # Retrieve the context of every question now rather than during the interview
+                    if not questions.get("questions"):
+                        return
+                    try:
+                        _, _, documents_retriever = get_knowledge_chains(
+                            load_model(os.getenv("OPENAI_API_KEY")), interview_state.knowledge_base_id
+                        )
+                        if documents_retriever is not None:
+                            save_question_contexts(precompute_question_contexts(
+                                questions["questions"], documents_retriever, interview_state.knowledge_base_id
+                            ))
+                            yield gr.update(value=f"{status}\n📚 Knowledge base context saved for each question."), gr.update()
+                    except Exception as e:
+                        print(f"[ERROR] Failed to precompute the question contexts: {e}")
+
                 generate_pdf_button.click(
                     update_pdf_ui,
-                    inputs=[pdf_file_input, num_questions_pdf_input],
+                    inputs=[pdf_file_input, num_questions_pdf_input, force_regenerate_input],
                     outputs=[pdf_status_output, pdf_question_output],
                 )
 
@@ -0,0 +1,76 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF for PDF handling
+
+# Below this many pages, starting worker processes costs more than it saves
+PARALLEL_EXTRACTION_MIN_PAGES = int(os.getenv("PARALLEL_EXTRACTION_MIN_PAGES", 64))
+PDF_EXTRACTION_MAX_WORKERS = int(os.getenv("PDF_EXTRACTION_MAX_WORKERS", os.cpu_count() or 1))
+
+
+def iter_pdf_pages(pdf_path, start=0, end=None):
+    """
+    Yields the text of the pages of a PDF one at a time, so only the page being
+    processed is held in memory.
+
+    Args:
+        pdf_path: Path of the PDF file.
+        start: Index of the first page to extract.
+        end: Index after the last page to extract. Defaults to the end of the document.
+    """
+    with fitz.open(pdf_path) as pdf:
+        end = pdf.page_count if end is None else min(end, pdf.page_count)
+        for page_number in range(start, end):
+            yield pdf.load_page(page_number).get_text()
+
+
+def iter_pdf_page_slices(pdf_path, pages_per_slice=8):
+    """Yields the text of a PDF in slices of pages_per_slice consecutive pages."""
+    pages = []
+    for page_text in iter_pdf_pages(pdf_path):
+        pages.append(page_text)
+        if len(pages) == pages_per_slice:
+            yield "".join(pages)
+            pages = []
+    if pages:
+        yield "".join(pages)
+
+
+def extract_pdf_text(pdf_path):
+    # Joined once at the end: linear in the size of the document
+    return "".join(iter_pdf_pages(pdf_path))
+
+
+def get_pdf_page_count(pdf_path):
+    with fitz.open(pdf_path) as pdf:
+        return pdf.page_count
+
+
+def _extract_page_range(page_range):
+    pdf_path, start, end = page_range
+    return "".join(iter_pdf_pages(pdf_path, start, end))
+
+
+def extract_pdf_text_parallel(pdf_path, max_workers=None, min_pages=PARALLEL_EXTRACTION_MIN_PAGES):
+    """
+    Extracts the text of a PDF with several processes: each worker opens the file
+    and extracts one contiguous range of pages, and the ranges are joined in page
+    order, so the result is the same as extract_pdf_text. Documents shorter than
+    min_pages are extracted in this process.
+    """
+    max_workers = max_workers or PDF_EXTRACTION_MAX_WORKERS
+    page_count = get_pdf_page_count(pdf_path)
+    n_workers = min(max_workers, page_count // max(min_pages // 2, 1))
+    if page_count < min_pages or n_workers < 2:
+        return extract_pdf_text(pdf_path)
+
+    # One range per worker, the first ones taking the remainder
+    pages_per_worker, remainder = divmod(page_count, n_workers)
+    page_ranges = []
+    start = 0
+    for worker in range(n_workers):
+        end = start + pages_per_worker + (worker < remainder)
+        page_ranges.append((pdf_path, start, end))
+        start = end
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        return "".join(executor.map(_extract_page_range, page_ranges))
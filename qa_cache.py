@@ -0,0 +1,114 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from langchain_core.prompts import format_document
+
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+
+def stream_retrieval_qa(chain, query, config=None):
+    """
+    Runs a "stuff" RetrievalQA chain but streams the answer: the documents are
+    retrieved and stuffed into the chain's prompt as RetrievalQA would, then the
+    LLM's output is yielded chunk by chunk as it is generated.
+    """
+    combine_documents_chain = chain.combine_documents_chain
+    llm_chain = combine_documents_chain.llm_chain
+    documents = chain.retriever.invoke(query, config=config)
+    context = combine_documents_chain.document_separator.join(
+        format_document(document, combine_documents_chain.document_prompt) for document in documents
+    )
+    prompt = llm_chain.prompt.format_prompt(**{combine_documents_chain.document_variable_name: context, "question": query})
+    for chunk in llm_chain.llm.stream(prompt, config=config):
+        yield getattr(chunk, "content", chunk)
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire ttl_seconds after being set."""
+
+    def __init__(self, max_entries=1024, ttl_seconds=24 * 60 * 60):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class CachedRetrievalQA:
+    """
+    Wraps a RetrievalQA chain so that repeated queries are answered from a cache.
+
+    The cache key is (index version, normalized query, prompt template, model,
+    retrieval settings): a new index version, prompt, model or search mode never
+    returns a stale answer. Everything other than invoke is delegated to the
+    wrapped chain.
+    """
+
+    def __init__(self, chain, cache, index_version, prompt_template, model_name, retrieval_settings=""):
+        self.chain = chain
+        self.cache = cache
+        self.index_version = index_version
+        self.prompt_hash = hashlib.sha1(prompt_template.encode("utf-8")).hexdigest()
+        self.model_name = model_name
+        self.retrieval_settings = retrieval_settings
+
+    def _key(self, query):
+        return (self.index_version, normalize_query(query), self.prompt_hash, self.model_name, self.retrieval_settings)
+
+    def invoke(self, inputs, *args, **kwargs):
+        key = self._key(inputs["query"])
+        result = self.cache.get(key)
+        if result is None:
+            result = self.chain.invoke(inputs, *args, **kwargs)
+            self.cache.set(key, result)
+        else:
+            print("[DEBUG] Answer served from the QA cache")
+        return copy.copy(result)
+
+    def stream(self, inputs, config=None):
+        """Yields the answer in chunks; a cached answer is yielded as a single chunk."""
+        key = self._key(inputs["query"])
+        result = self.cache.get(key)
+        if result is not None:
+            print("[DEBUG] Answer served from the QA cache")
+            yield result["result"]
+            return
+
+        answer = ""
+        for chunk in stream_retrieval_qa(self.chain, inputs["query"], config):
+            answer += chunk
+            yield chunk
+        self.cache.set(key, {"query": inputs["query"], "result": answer})
+
+    def __getattr__(self, name):
+        return getattr(self.chain, name)
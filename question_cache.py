@@ -0,0 +1,88 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+QUESTION_CACHE_PATH = os.getenv("QUESTION_CACHE_PATH", "question_cache.json")
+QUESTION_CACHE_MAX_ENTRIES = int(os.getenv("QUESTION_CACHE_MAX_ENTRIES", 2048))
+
+
+def question_cache_key(text, n_questions, model, prompt):
+    """
+    Key of the questions generated from a chunk: (chunk hash, number of
+    questions, model, prompt version), where the prompt version is a hash of
+    the prompt text, so editing the prompt never returns stale questions.
+    """
+    chunk_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    prompt_version = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+    return f"{chunk_hash}:{n_questions}:{model}:{prompt_version}"
+
+
+class QuestionCache:
+    """
+    Thread-safe LRU cache of generated questions, persisted as a JSON file.
+
+    The file keeps the entries least recently used first and is rewritten
+    (atomically) on every change; once there are more than max_entries, the
+    least recently used ones are dropped.
+    """
+
+    def __init__(self, path=QUESTION_CACHE_PATH, max_entries=QUESTION_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        self._entries = OrderedDict()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._entries.update(json.load(f))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"[WARNING] Ignoring unreadable question cache {self.path}: {e}")
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"[WARNING] Failed to save the question cache {self.path}: {e}")
+
+    def get(self, key):
+        with self._lock:
+            self._load()
+            questions = self._entries.get(key)
+            if questions is None:
+                return None
+            # Only the in-memory order is refreshed; it is persisted with the next set
+            self._entries.move_to_end(key)
+            return list(questions)
+
+    def set(self, key, questions):
+        with self._lock:
+            self._load()
+            self._entries[key] = list(questions)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._save()
+
+    def clear(self):
+        with self._lock:
+            self._entries = OrderedDict()
+            self._save()
+
+    def __len__(self):
+        with self._lock:
+            self._load()
+            return len(self._entries)
+
+
+question_cache = QuestionCache()
@@ -0,0 +1,85 @@
+import math
+import os
+
+import numpy as np
+from sklearn.cluster import KMeans
+
+# Questions asked from one chunk, i.e. per question-generation call
+QUESTIONS_PER_CALL = int(os.getenv("QUESTIONS_PER_CALL", 5))
+KMEANS_ITERATIONS = 20
+
+
+def embed_chunks(chunks):
+    # Imported here: knowledge_retrieval loads the LangChain stack and the prompts
+    from knowledge_retrieval import get_embedding_model
+
+    vectors = np.array(get_embedding_model().embed_documents(chunks), dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def cluster_representatives(vectors, k, seed=0):
+    """
+    Clusters the vectors with k-means and returns, for each cluster, the index of
+    the vector nearest its centroid and the size of the cluster. No vector
+    represents two clusters.
+    """
+    if k >= len(vectors):
+        return list(range(len(vectors))), [1] * len(vectors)
+    kmeans = KMeans(n_clusters=k, max_iter=KMEANS_ITERATIONS, n_init=1, random_state=seed).fit(vectors)
+    cluster_sizes = np.bincount(kmeans.labels_, minlength=k)
+
+    # Distances of every vector to every centroid, nearest first per centroid
+    distances = kmeans.transform(vectors).T
+    representatives = []
+    used = set()
+    for centroid in range(k):
+        nearest = next(int(i) for i in np.argsort(distances[centroid]) if int(i) not in used)
+        used.add(nearest)
+        representatives.append(nearest)
+    return representatives, cluster_sizes.tolist()
+
+
+def allocate_questions(n_questions, weights):
+    """Splits n_questions proportionally to weights (largest remainders first), at least one each."""
+    weights = np.maximum(np.asarray(weights, dtype=np.float64), 1)
+    shares = (n_questions - len(weights)) * weights / weights.sum()
+    counts = 1 + np.floor(shares).astype(int)
+    for i in np.argsort(-(shares - np.floor(shares)), kind="stable")[:n_questions - counts.sum()]:
+        counts[i] += 1
+    return counts.tolist()
+
+
+def select_question_chunks(chunks, n_questions, questions_per_call=QUESTIONS_PER_CALL):
+    """
+    Picks the chunks to generate questions from, spread over the whole document.
+
+    The chunks are embedded and clustered into about n_questions / questions_per_call
+    groups of similar content; the chunk nearest each cluster center is selected,
+    and the questions are split between them in proportion to the cluster sizes.
+    This bounds the number of generation calls and covers every topic rather than
+    only the first pages. If the chunks cannot be embedded, evenly spaced chunks
+    are selected instead.
+
+    Returns:
+        The number of questions to generate from each chunk (0 for the chunks
+        not selected), in chunk order, as distribute_questions_across_chunks does.
+    """
+    # Gradio number inputs arrive as floats (10.0)
+    n_questions = int(n_questions)
+    n_chunks = len(chunks)
+    if n_chunks == 0 or n_questions <= 0:
+        return [0] * n_chunks
+    k = min(n_chunks, n_questions, max(1, math.ceil(n_questions / questions_per_call)))
+
+    try:
+        representatives, cluster_sizes = cluster_representatives(embed_chunks(chunks), k)
+    except Exception as e:
+        print(f"[WARNING] Chunk embedding failed, selecting evenly spaced chunks: {e!r}")
+        representatives = np.linspace(0, n_chunks - 1, k).round().astype(int).tolist()
+        cluster_sizes = [1] * k
+
+    questions_distribution = [0] * n_chunks
+    for chunk_index, count in zip(representatives, allocate_questions(n_questions, cluster_sizes)):
+        questions_distribution[chunk_index] = count
+    print(f"[DEBUG] Selected {len(representatives)} of {n_chunks} chunks for {n_questions} questions")
+    return questions_distribution
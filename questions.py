@@ -1,42 +1,22 @@
 import os
 import json
 from dotenv import load_dotenv
-import fitz  # PyMuPDF
+from pdf_extraction import extract_pdf_text_parallel
+from dedup import deduplicate_texts
+from chunking import TokenChunker
+from question_cache import question_cache, question_cache_key
+from question_selection import select_question_chunks
 from langchain_openai import ChatOpenAI  # Correct import from langchain-openai
 from langchain.schema import HumanMessage, SystemMessage  # For creating structured chat messages
+from token_budget import count_tokens, prompt_budget, truncate_to_tokens, record_chat_usage
 
 QUESTIONS_PATH = "questions.json"
+# Size of the chunks questions are generated from, in tokens
+CHUNK_TOKENS = 500
 
 # Load environment variables
 load_dotenv()
 
-def split_text_into_chunks(text: str, chunk_size: int) -> list:
-    """
-    Splits the text into chunks of a specified maximum size.
-    """
-    # Trim the text to remove leading/trailing whitespace and reduce multiple spaces to a single space
-    cleaned_text = " ".join(text.split())
-    words = cleaned_text.split(" ")
-
-    chunks = []
-    current_chunk = []
-    current_length = 0
-
-    for word in words:
-        if current_length + len(word) + 1 > chunk_size:
-            chunks.append(" ".join(current_chunk))
-            current_chunk = [word]
-            current_length = len(word)
-        else:
-            current_chunk.append(word)
-            current_length += len(word) + 1
-
-    if current_chunk:
-        chunks.append(" ".join(current_chunk))
-
-    return chunks
-
-
 def distribute_questions_across_chunks(n_chunks: int, n_questions: int) -> list:
     """
     Distributes a specified number of questions across a specified number of chunks.
@@ -58,20 +38,16 @@ def distribute_questions_across_chunks(n_chunks: int, n_questions: int) -> list:
 
 
 def extract_text_from_pdf(pdf_path):
-    text = ""
     try:
-        print(f"[DEBUG] Opening PDF: {pdf_path}")
-        with fitz.open(pdf_path) as pdf:
-            print(f"[DEBUG] Extracting text from PDF: {pdf_path}")
-            for page in pdf:
-                text += page.get_text()
+        print(f"[DEBUG] Extracting text from PDF: {pdf_path}")
+        text = extract_pdf_text_parallel(pdf_path)
     except Exception as e:
         print(f"Error reading PDF: {e}")
         raise RuntimeError("Unable to extract text from PDF.")
     return text
 
 
-def generate_questions_from_text(text, n_questions=5):
+def generate_questions_from_text(text, n_questions=5, force_regenerate=False):
     openai_api_key = os.getenv("OPENAI_API_KEY")
 
     if not openai_api_key:
@@ -79,24 +55,38 @@ def generate_questions_from_text(text, n_questions=5):
             "OpenAI API key not found. Please add it to your .env file as OPENAI_API_KEY."
         )
 
+    model = "gpt-4"
+    max_output_tokens = 750
     chat = ChatOpenAI(
-        openai_api_key=openai_api_key, model="gpt-4", temperature=0.7, max_tokens=750
+        openai_api_key=openai_api_key, model=model, temperature=0.7, max_tokens=max_output_tokens
     )
 
+    system_content = "You are an expert interviewer who generates concise technical interview questions. Do not enumerate the questions. Answer only with questions."
+    instruction = f"Based on the following content, generate {n_questions} technical interview questions:\n"
+    # Cut the content so the request fits the model's context window
+    reserved_tokens = count_tokens(system_content + instruction, model) + 20
+    text = truncate_to_tokens(text, prompt_budget(model, max_output_tokens, reserved_tokens), model)
+
+    # Unchanged chunks reuse the questions generated for them before
+    cache_key = question_cache_key(text, n_questions, model, system_content + instruction)
+    if not force_regenerate:
+        questions = question_cache.get(cache_key)
+        if questions is not None:
+            print(f"[DEBUG] Reusing {len(questions)} cached questions.")
+            return questions
+
     messages = [
-        SystemMessage(
-            content="You are an expert interviewer who generates concise technical interview questions. Do not enumerate the questions. Answer only with questions."
-        ),
-        HumanMessage(
-            content=f"Based on the following content, generate {n_questions} technical interview questions:\n{text}"
-        ),
+        SystemMessage(content=system_content),
+        HumanMessage(content=instruction + text),
     ]
 
     try:
         print(f"[DEBUG] Sending request to OpenAI with {n_questions} questions.")
         response = chat.invoke(messages)
+        record_chat_usage("generate_questions", model, system_content + instruction + text, response)
         questions = response.content.strip().split("\n\n")
         questions = [q.strip() for q in questions if q.strip()]
+        question_cache.set(cache_key, questions)
     except Exception as e:
         print(f"[ERROR] Failed to generate questions: {e}")
         questions = ["An error occurred while generating questions."]
@@ -109,24 +99,28 @@ def save_questions(questions):
         json.dump(questions, f, indent=4)
 
 
-def generate_and_save_questions_from_pdf(pdf_path, total_questions=5):
+def generate_and_save_questions_from_pdf(pdf_path, total_questions=5, force_regenerate=False):
     print(f"[INFO] Generating questions from PDF: {pdf_path}")
     pdf_text = extract_text_from_pdf(pdf_path)
 
     if not pdf_text.strip():
         raise RuntimeError("The PDF content is empty or could not be read.")
 
-    chunk_size = 2000
-    chunks = split_text_into_chunks(pdf_text, chunk_size)
+    # Chunks end on section and sentence boundaries, sized in model tokens
+    chunks = TokenChunker(chunk_tokens=CHUNK_TOKENS, overlap_tokens=0).split_text(pdf_text)
+    # Repeated boilerplate would otherwise get questions (and API calls) of its own
+    kept_indices, _ = deduplicate_texts(chunks)
+    chunks = [chunks[i] for i in kept_indices]
     n_chunks = len(chunks)
 
-    questions_distribution = distribute_questions_across_chunks(n_chunks, total_questions)
+    # A few representative chunks spread over the document get all the questions
+    questions_distribution = select_question_chunks(chunks, total_questions)
     combined_questions = []
 
     for i, (chunk, n_questions) in enumerate(zip(chunks, questions_distribution)):
         print(f"[DEBUG] Processing chunk {i + 1} of {n_chunks}")
         if n_questions > 0:
-            questions = generate_questions_from_text(chunk, n_questions=n_questions)
+            questions = generate_questions_from_text(chunk, n_questions=n_questions, force_regenerate=force_regenerate)
             combined_questions.extend(questions)
 
     print(f"[INFO] Total questions generated: {len(combined_questions)}")
@@ -0,0 +1,188 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+import numpy as np
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import Embeddings
+
+from token_budget import DEFAULT_MODEL, count_tokens
+
+
+class LogSink:
+    """Prints every stage record as one line of JSON."""
+
+    def emit(self, record):
+        print(f"[METRICS] {json.dumps(record)}")
+
+
+class HistogramSink:
+    """Keeps the latest durations of every (chain, stage) in memory, for percentiles."""
+
+    def __init__(self, max_samples=10000):
+        self.max_samples = max_samples
+        self._samples = defaultdict(lambda: deque(maxlen=self.max_samples))
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        with self._lock:
+            self._samples[(record["chain"], record["stage"])].append(record["seconds"])
+
+    def summary(self):
+        """Returns {(chain, stage): {"count", "p50", "p95", "p99", "max"}}, durations in seconds."""
+        with self._lock:
+            samples = {key: np.array(values) for key, values in self._samples.items()}
+        return {
+            key: {
+                "count": len(values),
+                "p50": float(np.percentile(values, 50)),
+                "p95": float(np.percentile(values, 95)),
+                "p99": float(np.percentile(values, 99)),
+                "max": float(values.max()),
+            }
+            for key, values in samples.items()
+        }
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+
+class FileSink:
+    """Appends every stage record to a JSON lines file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+
+# Stage records go to every sink of metrics_sinks. The in-memory histogram is
+# always on; RAG_METRICS_LOG=1 adds the log sink and RAG_METRICS_FILE a file sink.
+stage_histogram = HistogramSink()
+metrics_sinks = [stage_histogram]
+if os.getenv("RAG_METRICS_LOG") == "1":
+    metrics_sinks.append(LogSink())
+if os.getenv("RAG_METRICS_FILE"):
+    metrics_sinks.append(FileSink(os.getenv("RAG_METRICS_FILE")))
+
+
+def record_stage(chain_name, stage, seconds, **fields):
+    record = {"time": time.time(), "chain": chain_name, "stage": stage, "seconds": seconds, **fields}
+    for sink in metrics_sinks:
+        try:
+            sink.emit(record)
+        except Exception as e:
+            print(f"[WARNING] Metrics sink {type(sink).__name__} failed: {e}")
+
+
+# Time spent embedding queries in the current thread, read by RAGMetricsHandler
+# to split the retrieval time into query embedding and index search
+_embedding_time = threading.local()
+
+
+def _embedding_seconds():
+    return getattr(_embedding_time, "seconds", 0.0)
+
+
+class TimedEmbeddings(Embeddings):
+    """Wraps the embedding model of a vector store to time query embedding."""
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        start = time.perf_counter()
+        try:
+            return self.embeddings.embed_query(text)
+        finally:
+            _embedding_time.seconds = _embedding_seconds() + time.perf_counter() - start
+
+
+def time_query_embeddings(documents_faiss_index):
+    if not isinstance(documents_faiss_index.embedding_function, TimedEmbeddings):
+        documents_faiss_index.embedding_function = TimedEmbeddings(documents_faiss_index.embedding_function)
+
+
+class RAGMetricsHandler(BaseCallbackHandler):
+    """
+    Callback handler timing the stages of one retrieval QA call: query embedding,
+    index search, prompt assembly and the LLM call, plus the whole chain. The
+    retrieval stage records the number of chunks and context tokens, the LLM
+    stage the prompt and completion tokens.
+
+    Use one handler per call, next to TokenUsageHandler in the call's callbacks.
+    """
+
+    def __init__(self, chain_name):
+        self.chain_name = chain_name
+        self._chain_starts = {}
+        self._retriever_depth = 0
+        self._retriever_start = None
+        self._embedding_start = 0.0
+        self._context_ready = None
+        self._llm_start = None
+        self._prompt_tokens = 0
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        if parent_run_id is None:
+            self._chain_starts[run_id] = time.perf_counter()
+            self._context_ready = time.perf_counter()
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        start = self._chain_starts.pop(run_id, None)
+        if start is not None:
+            record_stage(self.chain_name, "total", time.perf_counter() - start)
+
+    def on_retriever_start(self, serialized, query, **kwargs):
+        # Retrievers wrap other retrievers: only the outermost one is timed
+        if self._retriever_depth == 0:
+            self._retriever_start = time.perf_counter()
+            self._embedding_start = _embedding_seconds()
+        self._retriever_depth += 1
+
+    def on_retriever_end(self, documents, **kwargs):
+        self._retriever_depth -= 1
+        if self._retriever_depth > 0:
+            return
+        self._context_ready = time.perf_counter()
+        retrieval_seconds = self._context_ready - self._retriever_start
+        embedding_seconds = _embedding_seconds() - self._embedding_start
+        context_tokens = sum(count_tokens(document.page_content) for document in documents)
+        record_stage(self.chain_name, "retrieval", retrieval_seconds,
+                     chunks=len(documents), context_tokens=context_tokens)
+        if embedding_seconds > 0:
+            record_stage(self.chain_name, "embed_query", embedding_seconds)
+            record_stage(self.chain_name, "search", retrieval_seconds - embedding_seconds)
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self._llm_start = time.perf_counter()
+        self._prompt_tokens = sum(count_tokens(prompt) for prompt in prompts)
+        if self._context_ready is not None:
+            record_stage(self.chain_name, "prompt_assembly", self._llm_start - self._context_ready)
+
+    def on_llm_end(self, response, **kwargs):
+        if self._llm_start is None:
+            return
+        llm_output = response.llm_output or {}
+        token_usage = llm_output.get("token_usage") or {}
+        model = llm_output.get("model_name", DEFAULT_MODEL)
+        completion_tokens = token_usage.get("completion_tokens")
+        if completion_tokens is None:
+            completion_tokens = sum(
+                count_tokens(generation.text, model) for generations in response.generations for generation in generations
+            )
+        record_stage(self.chain_name, "llm", time.perf_counter() - self._llm_start,
+                     prompt_tokens=token_usage.get("prompt_tokens", self._prompt_tokens),
+                     completion_tokens=completion_tokens)
+        self._llm_start = None
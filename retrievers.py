@@ -0,0 +1,257 @@
+import json
+import math
+import re
+from collections import Counter
+
+import faiss
+import numpy as np
+from langchain_core.pydantic_v1 import PrivateAttr
+from langchain_core.retrievers import BaseRetriever
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9+#._-]*")
+
+
+def tokenize(text):
+    """
+    Lowercases the text and splits it into terms. Characters like "+", "#", "." and
+    "-" are kept inside a term so skill and tool names ("c++", "c#", "scikit-learn",
+    "node.js") stay exact-matchable.
+    """
+    return [token.rstrip("._-") for token in TOKEN_PATTERN.findall(text.lower())]
+
+
+class BM25Index:
+    """
+    Compact inverted index scored with Okapi BM25.
+
+    Postings map each term to {doc_id: term frequency}. The index is updated
+    incrementally as chunks are added to or removed from the FAISS store, and is
+    persisted as JSON next to it.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}
+        self.doc_lengths = {}
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def add(self, doc_id, text):
+        if doc_id in self.doc_lengths:
+            # The previous text is not known here: find its terms in the postings
+            self._remove_terms(doc_id, [term for term, term_postings in self.postings.items() if doc_id in term_postings])
+        terms = tokenize(text)
+        for term, tf in Counter(terms).items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+        self.doc_lengths[doc_id] = len(terms)
+        self.total_length += len(terms)
+
+    def remove(self, doc_id, text):
+        """Removes a document; text must be the text it was added with."""
+        self._remove_terms(doc_id, set(tokenize(text)))
+
+    def _remove_terms(self, doc_id, terms):
+        if doc_id not in self.doc_lengths:
+            return
+        for term in terms:
+            term_postings = self.postings.get(term)
+            if term_postings is None:
+                continue
+            term_postings.pop(doc_id, None)
+            if not term_postings:
+                del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(doc_id)
+
+    def search(self, query, k=4):
+        """Returns up to k (doc_id, score) pairs, best first."""
+        n_docs = len(self.doc_lengths)
+        if n_docs == 0:
+            return []
+        avg_length = self.total_length / n_docs
+
+        scores = Counter()
+        for term in set(tokenize(query)):
+            term_postings = self.postings.get(term)
+            if not term_postings:
+                continue
+            idf = math.log(1 + (n_docs - len(term_postings) + 0.5) / (len(term_postings) + 0.5))
+            for doc_id, tf in term_postings.items():
+                length_norm = 1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+        return scores.most_common(k)
+
+    @classmethod
+    def from_faiss(cls, documents_faiss_index):
+        bm25_index = cls()
+        for doc_id in documents_faiss_index.index_to_docstore_id.values():
+            bm25_index.add(doc_id, documents_faiss_index.docstore.search(doc_id).page_content)
+        return bm25_index
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"k1": self.k1, "b": self.b, "doc_lengths": self.doc_lengths, "postings": self.postings},
+                f,
+                separators=(",", ":"),
+            )
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        bm25_index = cls(k1=data["k1"], b=data["b"])
+        bm25_index.doc_lengths = data["doc_lengths"]
+        bm25_index.postings = data["postings"]
+        bm25_index.total_length = sum(bm25_index.doc_lengths.values())
+        return bm25_index
+
+
+def dense_search(documents_faiss_index, query, k):
+    """Returns up to k docstore IDs from the FAISS index, nearest first."""
+    if documents_faiss_index.index.ntotal == 0:
+        return []
+    positions = dense_search_by_vector(documents_faiss_index, documents_faiss_index.embeddings.embed_query(query), k)
+    return [documents_faiss_index.index_to_docstore_id[position] for position in positions]
+
+
+def dense_search_by_vector(documents_faiss_index, query_vector, k):
+    """Returns the FAISS positions (index labels) of up to k vectors, nearest first."""
+    if documents_faiss_index.index.ntotal == 0:
+        return []
+    query_vector = np.array([query_vector], dtype=np.float32)
+    _, positions = documents_faiss_index.index.search(query_vector, k)
+    return [int(i) for i in positions[0] if i != -1]
+
+
+def get_vectors(documents_faiss_index, positions):
+    """
+    Reads the stored vectors at some FAISS positions back from the index in one
+    batch, as a (len(positions), dimension) float32 array. IVF indexes need the
+    direct map set up by faiss_indexes.enable_reconstruction when they are
+    loaded; their vectors are the (approximate) product-quantized reconstructions.
+    """
+    index = documents_faiss_index.index
+    ivf_index = faiss.try_extract_index_ivf(index)
+    if ivf_index is not None and ivf_index.direct_map.type == faiss.DirectMap.NoMap:
+        raise RuntimeError("The IVF index was loaded without a direct map: call enable_reconstruction on load.")
+    if len(positions) == 0:
+        return np.empty((0, index.d), dtype=np.float32)
+    return index.reconstruct_batch(np.asarray(positions, dtype=np.int64))
+
+
+def mmr_select(query_vector, candidate_vectors, k, lambda_mult=0.5):
+    """
+    Maximal marginal relevance: picks k candidates one at a time, each maximizing
+    lambda_mult * sim(query, c) - (1 - lambda_mult) * max sim(c, already picked),
+    with cosine similarities. All similarities are computed up front as one matrix
+    product; each step only updates the running max over the picked candidates.
+
+    Returns the positions of the picked candidates, in pick order.
+    """
+    n_candidates = len(candidate_vectors)
+    if n_candidates == 0 or k <= 0:
+        return []
+    candidates = np.asarray(candidate_vectors, dtype=np.float32)
+    candidates = candidates / np.maximum(np.linalg.norm(candidates, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_vector, dtype=np.float32)
+    query = query / max(np.linalg.norm(query), 1e-12)
+
+    relevance = candidates @ query
+    similarity = candidates @ candidates.T
+    redundancy = np.full(n_candidates, -np.inf, dtype=np.float32)
+    available = np.ones(n_candidates, dtype=bool)
+    selected = []
+    for _ in range(min(k, n_candidates)):
+        # Nothing is redundant before the first pick
+        scores = lambda_mult * relevance
+        if selected:
+            scores = scores - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        position = int(np.argmax(scores))
+        selected.append(position)
+        available[position] = False
+        redundancy = np.maximum(redundancy, similarity[position])
+    return selected
+
+
+def reciprocal_rank_fusion(rankings, k=4, rrf_k=60):
+    """Fuses several ranked ID lists into one, scoring each ID by sum(1 / (rrf_k + rank))."""
+    scores = Counter()
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] += 1.0 / (rrf_k + rank + 1)
+    return [doc_id for doc_id, _ in scores.most_common(k)]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retriever that combines dense FAISS search with BM25 keyword search.
+
+    Both rankings are cut at fetch_k candidates and fused with reciprocal rank
+    fusion, so chunks that contain exact terms from the query (skills,
+    certifications, tool names) are found even when their embedding is not close.
+    """
+
+    vectorstore: object
+    bm25_index: object
+    k: int = 4
+    fetch_k: int = 20
+    rrf_k: int = 60
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        dense_ids = dense_search(self.vectorstore, query, self.fetch_k)
+        keyword_ids = [doc_id for doc_id, _ in self.bm25_index.search(query, self.fetch_k)]
+        doc_ids = reciprocal_rank_fusion([dense_ids, keyword_ids], k=self.k, rrf_k=self.rrf_k)
+        return [self.vectorstore.docstore.search(doc_id) for doc_id in doc_ids]
+
+
+class MMRRetriever(BaseRetriever):
+    """
+    Retriever that trades some relevance for diversity with maximal marginal
+    relevance, so repeated sections of a document do not fill the context with
+    near-identical chunks.
+
+    The fetch_k nearest chunks (fused with the BM25 results when a bm25_index is
+    given) are re-ranked on their stored vectors; lambda_mult is 1 for pure
+    relevance and 0 for maximal diversity.
+    """
+
+    vectorstore: object
+    bm25_index: object = None
+    k: int = 4
+    fetch_k: int = 20
+    lambda_mult: float = 0.5
+    rrf_k: int = 60
+    _doc_positions: dict = PrivateAttr(default=None)
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_doc_positions(self):
+        # Docstore ID -> FAISS position of the served store, built on first use:
+        # only BM25 candidates need it, dense results come with their positions
+        if self._doc_positions is None:
+            self._doc_positions = {
+                doc_id: position for position, doc_id in self.vectorstore.index_to_docstore_id.items()
+            }
+        return self._doc_positions
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        if self.vectorstore.index.ntotal == 0:
+            return []
+        query_vector = self.vectorstore.embeddings.embed_query(query)
+        positions = dense_search_by_vector(self.vectorstore, query_vector, self.fetch_k)
+        doc_ids = [self.vectorstore.index_to_docstore_id[position] for position in positions]
+        if self.bm25_index is not None:
+            keyword_ids = [doc_id for doc_id, _ in self.bm25_index.search(query, self.fetch_k)]
+            doc_ids = reciprocal_rank_fusion([doc_ids, keyword_ids], k=self.fetch_k, rrf_k=self.rrf_k)
+            doc_positions = self._get_doc_positions()
+            positions = [doc_positions[doc_id] for doc_id in doc_ids]
+        selected = mmr_select(query_vector, get_vectors(self.vectorstore, positions), self.k, self.lambda_mult)
+        return [self.vectorstore.docstore.search(doc_ids[position]) for position in selected]
@@ -1,3 +1,13 @@
+import os
+
 # Interview settings
 language = "english"  # Default language
-n_of_questions = 5  # Default number of questions
\ No newline at end of file
+n_of_questions = 5  # Default number of questions
+
+# Knowledge retrieval settings
+embedding_backend = os.getenv("EMBEDDING_BACKEND", "openai")  # "openai" or "local"
+retrieval_mode = os.getenv("RETRIEVAL_MODE", "hybrid")  # "dense" or "hybrid" (dense + BM25)
+search_type = os.getenv("SEARCH_TYPE", "similarity")  # "similarity" or "mmr" (relevant and diverse chunks)
+mmr_fetch_k = int(os.getenv("MMR_FETCH_K", 20))  # Candidates re-ranked by MMR
+mmr_lambda = float(os.getenv("MMR_LAMBDA", 0.5))  # 1 = relevance only, 0 = diversity only
+faiss_index_type = os.getenv("FAISS_INDEX_TYPE", "flat")  # "flat", "hnsw" (rebuilt on every edit) or "ivfpq"
@@ -1,31 +1,7 @@
 from typing import List, Tuple
 import math
 
-def split_text_into_chunks(text: str, chunk_size: int) -> List[str]:
-    """
-    Splits the text into chunks of a specified maximum size.
-    """
-    # Trim the text to remove leading/trailing whitespace and reduce multiple spaces to a single space
-    cleaned_text = " ".join(text.split())
-    words = cleaned_text.split(" ")
-
-    chunks = []
-    current_chunk = []
-    current_length = 0
-
-    for word in words:
-        if current_length + len(word) + 1 > chunk_size:
-            chunks.append(" ".join(current_chunk))
-            current_chunk = [word]
-            current_length = len(word)
-        else:
-            current_chunk.append(word)
-            current_length += len(word) + 1
-
-    if current_chunk:
-        chunks.append(" ".join(current_chunk))
-
-    return chunks
+from chunking import split_text_into_chunks
 
 
 def distribute_questions_across_chunks(n_chunks: int, n_questions: int) -> List[int]:
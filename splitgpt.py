@@ -1,42 +1,26 @@
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import islice
 from dotenv import load_dotenv
-import fitz  # PyMuPDF
+from pdf_extraction import extract_pdf_text_parallel, iter_pdf_pages
+from dedup import deduplicate_texts
+from chunking import TokenChunker, iter_word_chunks
+from question_cache import question_cache, question_cache_key
+from question_selection import select_question_chunks
 from langchain_openai import ChatOpenAI  # Correct import from langchain-openai
 from langchain.schema import HumanMessage, SystemMessage  # For creating structured chat messages
+from token_budget import count_tokens, prompt_budget, truncate_to_tokens, record_chat_usage
 
 QUESTIONS_PATH = "questions.json"
+# Size of the chunks questions are generated from, in tokens
+CHUNK_TOKENS = 500
+# Question generation requests sent to the API at the same time
+QUESTION_GENERATION_MAX_WORKERS = int(os.getenv("QUESTION_GENERATION_MAX_WORKERS", 4))
 
 # Load environment variables
 load_dotenv()
 
-def split_text_into_chunks(text: str, chunk_size: int) -> list:
-    """
-    Splits the text into chunks of a specified maximum size.
-    """
-    # Trim the text to remove leading/trailing whitespace and reduce multiple spaces to a single space
-    cleaned_text = " ".join(text.split())
-    words = cleaned_text.split(" ")
-
-    chunks = []
-    current_chunk = []
-    current_length = 0
-
-    for word in words:
-        if current_length + len(word) + 1 > chunk_size:
-            chunks.append(" ".join(current_chunk))
-            current_chunk = [word]
-            current_length = len(word)
-        else:
-            current_chunk.append(word)
-            current_length += len(word) + 1
-
-    if current_chunk:
-        chunks.append(" ".join(current_chunk))
-
-    return chunks
-
-
 def distribute_questions_across_chunks(n_chunks: int, n_questions: int) -> list:
     """
     Distributes a specified number of questions across a specified number of chunks.
@@ -58,20 +42,16 @@ def distribute_questions_across_chunks(n_chunks: int, n_questions: int) -> list:
 
 
 def extract_text_from_pdf(pdf_path):
-    text = ""
     try:
-        print(f"[DEBUG] Opening PDF: {pdf_path}")
-        with fitz.open(pdf_path) as pdf:
-            print(f"[DEBUG] Extracting text from PDF: {pdf_path}")
-            for page in pdf:
-                text += page.get_text()
+        print(f"[DEBUG] Extracting text from PDF: {pdf_path}")
+        text = extract_pdf_text_parallel(pdf_path)
     except Exception as e:
         print(f"Error reading PDF: {e}")
         raise RuntimeError("Unable to extract text from PDF.")
     return text
 
 
-def generate_questions_from_text(text, n_questions=5):
+def generate_questions_from_text(text, n_questions=5, force_regenerate=False):
     openai_api_key = os.getenv("OPENAI_API_KEY")
 
     if not openai_api_key:
@@ -79,24 +59,38 @@ def generate_questions_from_text(text, n_questions=5):
             "OpenAI API key not found. Please add it to your .env file as OPENAI_API_KEY."
         )
 
+    model = "gpt-4"
+    max_output_tokens = 750
     chat = ChatOpenAI(
-        openai_api_key=openai_api_key, model="gpt-4", temperature=0.7, max_tokens=750
+        openai_api_key=openai_api_key, model=model, temperature=0.7, max_tokens=max_output_tokens
     )
 
+    system_content = "You are an expert interviewer who generates concise technical interview questions. Do not enumerate the questions. Answer only with questions."
+    instruction = f"Based on the following content, generate {n_questions} technical interview questions:\n"
+    # Cut the content so the request fits the model's context window
+    reserved_tokens = count_tokens(system_content + instruction, model) + 20
+    text = truncate_to_tokens(text, prompt_budget(model, max_output_tokens, reserved_tokens), model)
+
+    # Unchanged chunks reuse the questions generated for them before
+    cache_key = question_cache_key(text, n_questions, model, system_content + instruction)
+    if not force_regenerate:
+        questions = question_cache.get(cache_key)
+        if questions is not None:
+            print(f"[DEBUG] Reusing {len(questions)} cached questions.")
+            return questions
+
     messages = [
-        SystemMessage(
-            content="You are an expert interviewer who generates concise technical interview questions. Do not enumerate the questions. Answer only with questions."
-        ),
-        HumanMessage(
-            content=f"Based on the following content, generate {n_questions} technical interview questions:\n{text}"
-        ),
+        SystemMessage(content=system_content),
+        HumanMessage(content=instruction + text),
     ]
 
     try:
         print(f"[DEBUG] Sending request to OpenAI with {n_questions} questions.")
         response = chat.invoke(messages)
+        record_chat_usage("generate_questions", model, system_content + instruction + text, response)
         questions = response.content.strip().split("\n\n")
         questions = [q.strip() for q in questions if q.strip()]
+        question_cache.set(cache_key, questions)
     except Exception as e:
         print(f"[ERROR] Failed to generate questions: {e}")
         questions = ["An error occurred while generating questions."]
@@ -104,12 +98,31 @@ def generate_questions_from_text(text, n_questions=5):
     return questions
 
 
+def iter_chunk_questions(chunks, questions_distribution, max_workers=QUESTION_GENERATION_MAX_WORKERS,
+                         force_regenerate=False):
+    """
+    Generates the questions of several chunks concurrently, with at most
+    max_workers requests in flight. Yields (chunk_index, questions) as each chunk
+    completes, in completion order; chunks given 0 questions are skipped.
+    """
+    jobs = [(i, chunk, n) for i, (chunk, n) in enumerate(zip(chunks, questions_distribution)) if n > 0]
+    if not jobs:
+        return
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(jobs)))) as executor:
+        futures = {
+            executor.submit(generate_questions_from_text, chunk, n_questions=n, force_regenerate=force_regenerate): i
+            for i, chunk, n in jobs
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
 def save_questions(questions):
     with open(QUESTIONS_PATH, "w") as f:
         json.dump(questions, f, indent=4)
 
 
-def generate_and_save_questions_from_pdf(pdf_path, total_questions=5):
+def generate_and_save_questions_from_pdf(pdf_path, total_questions=5, force_regenerate=False):
     print(f"[INFO] Generating questions from PDF: {pdf_path}")
     
     try:
@@ -118,17 +131,21 @@ def generate_and_save_questions_from_pdf(pdf_path, total_questions=5):
         if not pdf_text.strip():
             raise RuntimeError("The PDF content is empty or could not be read.")
 
-        chunk_size = 2000
-        chunks = split_text_into_chunks(pdf_text, chunk_size)
+        # Chunks end on section and sentence boundaries, sized in model tokens
+        chunks = TokenChunker(chunk_tokens=CHUNK_TOKENS, overlap_tokens=0).split_text(pdf_text)
+        # Repeated boilerplate would otherwise get questions (and API calls) of its own
+        kept_indices, _ = deduplicate_texts(chunks)
+        chunks = [chunks[i] for i in kept_indices]
         n_chunks = len(chunks)
 
-        questions_distribution = distribute_questions_across_chunks(n_chunks, total_questions)
+        # A few representative chunks spread over the document get all the questions
+        questions_distribution = select_question_chunks(chunks, total_questions)
         combined_questions = []
 
         for i, (chunk, n_questions) in enumerate(zip(chunks, questions_distribution)):
             print(f"[DEBUG] Processing chunk {i + 1} of {n_chunks}")
             if n_questions > 0:
-                questions = generate_questions_from_text(chunk, n_questions=n_questions)
+                questions = generate_questions_from_text(chunk, n_questions=n_questions, force_regenerate=force_regenerate)
                 combined_questions.extend(questions)
 
         if not combined_questions:
@@ -213,19 +230,20 @@ def generate_and_save_questions_from_pdf3_v1(pdf_path, total_questions=5):
     yield "📄 PDF uploaded successfully. Processing started...", {}
 
     try:
-        # Extract text from the PDF file
-        pdf_text = extract_text_from_pdf(pdf_path)
+        # Extract and split the PDF page by page. Only the first total_questions
+        # chunks get questions (see distribute_questions_across_chunks), so the
+        # rest of the document is not read; one more chunk tells an empty
+        # document from one starting with an oversized word.
+        chunk_size = 2000  # Adjust this as necessary
+        chunks = list(islice(iter_word_chunks(iter_pdf_pages(pdf_path), chunk_size), total_questions + 1))
 
-        if not pdf_text.strip():
+        if not any(chunks):
             yield "❌ Error: The PDF content is empty or could not be read.", {}
             return
 
-        # Split the PDF content into chunks
-        chunk_size = 2000  # Adjust this as necessary
-        chunks = split_text_into_chunks(pdf_text, chunk_size)
         n_chunks = len(chunks)
 
-        yield f"🔄 Splitting text into {n_chunks} chunks...", {}
+        yield f"🔄 Splitting text into chunks ({n_chunks} read)...", {}
 
         # Distribute the total number of questions across chunks
         questions_distribution = distribute_questions_across_chunks(n_chunks, total_questions)
@@ -259,7 +277,7 @@ def generate_and_save_questions_from_pdf3_v1(pdf_path, total_questions=5):
 import json
 import os
 
-def generate_and_save_questions_from_pdf3(pdf_path, total_questions=5):
+def generate_and_save_questions_from_pdf3(pdf_path, total_questions=5, force_regenerate=False):
     print(f"[INFO] Generating questions from PDF: {pdf_path}")
 
     if not os.path.exists(pdf_path):
@@ -277,22 +295,28 @@ def generate_and_save_questions_from_pdf3(pdf_path, total_questions=5):
             return
 
         # Split the PDF content into chunks
-        chunk_size = 2000  # Adjust this as necessary
-        chunks = split_text_into_chunks(pdf_text, chunk_size)
+        # Chunks end on section and sentence boundaries, sized in model tokens
+        chunks = TokenChunker(chunk_tokens=CHUNK_TOKENS, overlap_tokens=0).split_text(pdf_text)
+        kept_indices, dedup_stats = deduplicate_texts(chunks)
+        chunks = [chunks[i] for i in kept_indices]
         n_chunks = len(chunks)
 
-        yield f"🔄 Splitting text into {n_chunks} chunks...", {}
+        yield (f"🔄 Splitting text into {n_chunks} chunks "
+               f"({dedup_stats['dropped']} near-duplicate chunks skipped)..."), {}
 
-        # Distribute the total number of questions across chunks
-        questions_distribution = distribute_questions_across_chunks(n_chunks, total_questions)
+        # A few representative chunks spread over the document get all the questions
+        questions_distribution = select_question_chunks(chunks, total_questions)
         combined_questions = []
 
-        # Process each chunk and generate questions
-        for i, (chunk, n_questions) in enumerate(zip(chunks, questions_distribution)):
-            yield f"🔄 Processing chunk {i + 1} of {n_chunks}...", {}
-            if n_questions > 0:
-                questions = generate_questions_from_text(chunk, n_questions=n_questions)
-                combined_questions.extend(questions)
+        # Generate the questions of the chunks concurrently; they are combined in
+        # chunk order whatever order the requests complete in
+        n_jobs = sum(1 for n_questions in questions_distribution if n_questions > 0)
+        chunk_questions = {}
+        for i, questions in iter_chunk_questions(chunks, questions_distribution, force_regenerate=force_regenerate):
+            chunk_questions[i] = questions
+            yield f"🔄 Processed chunk {i + 1} ({len(chunk_questions)} of {n_jobs} done)...", {}
+        for i in sorted(chunk_questions):
+            combined_questions.extend(chunk_questions[i])
 
         if not combined_questions:
             yield "❌ Error: No questions generated from the PDF content.", {}
@@ -0,0 +1,166 @@
+import functools
+import threading
+import time
+from collections import deque
+
+import tiktoken
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.retrievers import BaseRetriever
+
+DEFAULT_MODEL = "gpt-3.5-turbo"
+
+# Context window of the models used in this project (prompt + completion)
+MODEL_CONTEXT_TOKENS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-3.5-turbo-1106": 16385,
+    "gpt-4": 8192,
+    "gpt-4o": 128000,
+}
+
+# Per-call prompt budgets
+HISTORY_TOKEN_BUDGET = 1500
+USER_INPUT_TOKEN_BUDGET = 500
+CONTEXT_TOKEN_BUDGET = 2000
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model=DEFAULT_MODEL):
+    """
+    Returns the tiktoken encoding of a model, or None if it cannot be loaded (e.g.
+    the encoding file cannot be downloaded), in which case token counts are
+    estimated at four characters per token.
+    """
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        print(f"[WARNING] tiktoken encoding unavailable for {model}, estimating token counts: {e}")
+        return None
+
+
+def count_tokens(text, model=DEFAULT_MODEL):
+    encoding = get_encoding(model)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def prompt_budget(model, max_output_tokens, reserved_tokens=0):
+    """Tokens left for the prompt once the completion and any fixed text are reserved."""
+    return MODEL_CONTEXT_TOKENS.get(model, 4096) - max_output_tokens - reserved_tokens
+
+
+def truncate_to_tokens(text, max_tokens, model=DEFAULT_MODEL, keep="head"):
+    """Cuts text down to max_tokens, keeping its beginning ("head") or its end ("tail")."""
+    encoding = get_encoding(model)
+    if encoding is None:
+        max_chars = max_tokens * 4
+        if len(text) <= max_chars:
+            return text
+        return text[:max_chars] if keep == "head" else text[-max_chars:]
+
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    tokens = tokens[:max_tokens] if keep == "head" else tokens[-max_tokens:]
+    return encoding.decode(tokens)
+
+
+def fit_history(entries, max_tokens, model=DEFAULT_MODEL):
+    """
+    Keeps the most recent history entries that fit in max_tokens, in their original
+    order. An entry that does not fit on its own is truncated to its last tokens.
+    """
+    kept = []
+    remaining = max_tokens
+    for entry in reversed(entries):
+        entry_tokens = count_tokens(entry, model)
+        if entry_tokens > remaining:
+            if not kept:
+                kept.append(truncate_to_tokens(entry, remaining, model, keep="tail"))
+            break
+        kept.append(entry)
+        remaining -= entry_tokens
+    return list(reversed(kept))
+
+
+# Tokens sent and received per call, most recent last
+usage_log = deque(maxlen=1000)
+_usage_lock = threading.Lock()
+
+
+def record_usage(call_name, model, tokens_in, tokens_out):
+    with _usage_lock:
+        usage_log.append({
+            "time": time.time(),
+            "call": call_name,
+            "model": model,
+            "tokens_in": tokens_in,
+            "tokens_out": tokens_out,
+        })
+    print(f"[DEBUG] {call_name} ({model}): {tokens_in} tokens in, {tokens_out} tokens out")
+
+
+def record_chat_usage(call_name, model, prompt, response):
+    """Records the usage of a chat model call, preferring the counts reported by the API."""
+    token_usage = getattr(response, "response_metadata", {}).get("token_usage") or {}
+    tokens_in = token_usage.get("prompt_tokens")
+    tokens_out = token_usage.get("completion_tokens")
+    if tokens_in is None:
+        tokens_in = count_tokens(prompt, model)
+    if tokens_out is None:
+        tokens_out = count_tokens(getattr(response, "content", str(response)), model)
+    record_usage(call_name, model, tokens_in, tokens_out)
+
+
+class TokenUsageHandler(BaseCallbackHandler):
+    """Callback handler recording the token usage of every LLM call made by a chain."""
+
+    def __init__(self, call_name):
+        self.call_name = call_name
+        self.prompt_tokens = 0
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.prompt_tokens = sum(count_tokens(prompt) for prompt in prompts)
+
+    def on_llm_end(self, response, **kwargs):
+        llm_output = response.llm_output or {}
+        token_usage = llm_output.get("token_usage") or {}
+        model = llm_output.get("model_name", DEFAULT_MODEL)
+        tokens_out = token_usage.get("completion_tokens")
+        if tokens_out is None:
+            tokens_out = sum(
+                count_tokens(generation.text, model) for generations in response.generations for generation in generations
+            )
+        record_usage(self.call_name, model, token_usage.get("prompt_tokens", self.prompt_tokens), tokens_out)
+
+
+class TokenBudgetRetriever(BaseRetriever):
+    """
+    Wraps a retriever so the documents it returns fit in max_tokens, keeping them in
+    rank order. The document that crosses the budget is truncated; the rest are
+    dropped. This bounds the context a "stuff" chain puts in its prompt.
+    """
+
+    retriever: BaseRetriever
+    max_tokens: int = CONTEXT_TOKEN_BUDGET
+    model: str = DEFAULT_MODEL
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        documents = self.retriever.invoke(query, config={"callbacks": run_manager.get_child()} if run_manager else None)
+        fitted = []
+        remaining = self.max_tokens
+        for document in documents:
+            if remaining <= 0:
+                break
+            document_tokens = count_tokens(document.page_content, self.model)
+            if document_tokens > remaining:
+                document = document.copy(update={
+                    "page_content": truncate_to_tokens(document.page_content, remaining, self.model)
+                })
+                document_tokens = remaining
+            fitted.append(document)
+            remaining -= document_tokens
+        return fitted